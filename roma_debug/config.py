@@ -4,12 +4,14 @@ This module is the single source of truth for all configuration.
 It loads the .env file once at import time and exposes settings lazily.
 """
 
+import functools
 import os
 from pathlib import Path
 
 from dotenv import load_dotenv
 
 
+@functools.lru_cache(maxsize=1)
 def _find_project_root() -> Path:
     """Find project root by searching for .env file.
 
@@ -19,22 +21,20 @@ def _find_project_root() -> Path:
     Returns:
         Path to project root directory
     """
-    current = Path(__file__).resolve().parent
+    package_dir = Path(__file__).resolve().parent
 
     # Search upward for .env file (max 5 levels)
-    for _ in range(5):
-        if (current / ".env").exists():
+    for current in (package_dir, *package_dir.parents)[:5]:
+        if os.path.isfile(os.path.join(current, ".env")):
             return current
-        if current.parent == current:
-            break
-        current = current.parent
 
     # Fallback: assume project root is parent of roma_debug/
-    return Path(__file__).resolve().parent.parent
+    return package_dir.parent
 
 
 _CACHED_API_KEY: str | None = None
-_CACHED_API_KEYS: list[str] | None = None
+_CACHED_API_KEYS: tuple[str, ...] | None = None
+_DOTENV_LOADED = False
 
 
 def _load_config() -> str | None:
@@ -43,15 +43,17 @@ def _load_config() -> str | None:
     Returns:
         The Gemini API key, or None if not set
     """
-    project_root = _find_project_root()
-    env_path = project_root / ".env"
-
-    # Load .env file
-    if env_path.exists():
-        load_dotenv(env_path, override=True)
-    else:
-        # Try loading from environment anyway
-        load_dotenv()
+    global _DOTENV_LOADED
+    if not _DOTENV_LOADED:
+        env_path = _find_project_root() / ".env"
+
+        # Load .env file (parsed once per process)
+        if os.path.isfile(env_path):
+            load_dotenv(env_path, override=True)
+        else:
+            # Try loading from environment anyway
+            load_dotenv()
+        _DOTENV_LOADED = True
 
     # Get API key from environment
     return os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
@@ -83,6 +85,14 @@ def _load_keys() -> list[str]:
     return [key] if key else []
 
 
+def env_int(name: str, default: int) -> int:
+    """Read an integer environment setting, falling back on missing or bad values."""
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
 def get_api_key() -> str | None:
     """Get the Gemini API key, loading once and caching."""
     global _CACHED_API_KEY
@@ -91,11 +101,11 @@ def get_api_key() -> str | None:
     return _CACHED_API_KEY
 
 
-def get_api_keys() -> list[str]:
+def get_api_keys() -> tuple[str, ...]:
     """Get all available Gemini API keys (rotation pool)."""
     global _CACHED_API_KEYS
     if _CACHED_API_KEYS is None:
-        _CACHED_API_KEYS = _load_keys()
+        _CACHED_API_KEYS = tuple(_load_keys())
     return _CACHED_API_KEYS
 
 
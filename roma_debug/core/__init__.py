@@ -1,5 +1,22 @@
 """Core modules for ROMA Debug."""
 
-from roma_debug.core.engine import analyze_error
+__all__ = ["analyze_error", "analyze_error_async", "analyze_error_stream", "analyze_errors_batch"]
 
-__all__ = ["analyze_error"]
+# Loaded on first access (PEP 562) so that importing roma_debug.core.models
+# does not pull in the Gemini SDK through the engine.
+_LAZY = {
+    "analyze_error": "roma_debug.core.engine",
+    "analyze_error_async": "roma_debug.core.engine",
+    "analyze_error_stream": "roma_debug.core.engine",
+    "analyze_errors_batch": "roma_debug.core.engine",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,18 +4,32 @@ Returns structured JSON responses for machine-readable fixes.
 Supports PATCH, ANSWER, and INVESTIGATE action types.
 """
 
+import asyncio
+import functools
+import hashlib
+import io
+import itertools
 import json
 import os
+import random
 import re
+import threading
 import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, InvalidStateError, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional, List, Tuple
+from typing import AsyncIterator, Generator, Iterator, Literal, Optional, List, Tuple, Union
 
+import httpx
 from google import genai
+from google.genai import errors as genai_errors
 from google.genai import types
+from pydantic import BaseModel
 
-from roma_debug.config import get_api_keys
+from roma_debug.config import env_int, get_api_keys
+from roma_debug.core import limiter, llm_cache
 from roma_debug.prompts import SYSTEM_PROMPT
 
 
@@ -25,7 +39,22 @@ FALLBACK_MODEL = "gemini-2.5-flash"
 FALLBACK_MODEL_LITE = "gemini-2.5-flash-lite"
 
 
-def _get_models_to_try() -> list[str]:
+def _env_flag(name: str) -> bool:
+    """Check whether a boolean environment flag is enabled."""
+    return os.environ.get(name, "").lower() in {"1", "true", "yes"}
+
+
+_DEFAULT_MODELS = (PRIMARY_MODEL, FALLBACK_MODEL, FALLBACK_MODEL_LITE)
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_models(env_models: str) -> Tuple[str, ...]:
+    models = (m.strip() for m in env_models.split(","))
+    # De-dupe while preserving order
+    return tuple(dict.fromkeys(m for m in models if m)) or _DEFAULT_MODELS
+
+
+def _get_models_to_try() -> Tuple[str, ...]:
     """Get model list from env override or default priority list."""
     env_models = (
         os.environ.get("ROMA_MODELS")
@@ -33,20 +62,10 @@ def _get_models_to_try() -> list[str]:
         or os.environ.get("GOOGLE_MODELS")
         or ""
     )
-    models = [m.strip() for m in env_models.split(",") if m.strip()]
-    if models:
-        # De-dupe while preserving order
-        seen = set()
-        ordered = []
-        for m in models:
-            if m not in seen:
-                seen.add(m)
-                ordered.append(m)
-        return ordered
-    return [PRIMARY_MODEL, FALLBACK_MODEL, FALLBACK_MODEL_LITE]
+    return _parse_models(env_models)
 
 # Placeholder paths that indicate the AI couldn't determine the real path
-INVALID_PATHS = {
+INVALID_PATHS = frozenset({
     "unknown",
     "path/to/file.py",
     "path/to/your/code.py",
@@ -55,17 +74,111 @@ INVALID_PATHS = {
     "your_file.py",
     "file.py",
     "",
-}
+})
+
+_INVALID_PATHS_CF = frozenset(p.casefold() for p in INVALID_PATHS)
+
+# Placeholder path patterns (e.g. "path/to/...", "<filename>")
+_INVALID_PATH_RE = re.compile(r"(?:path/to/|your[_-]|example[_-]?|<.*>)", re.IGNORECASE)
+
+# Parses the first JSON object embedded in a non-JSON reply
+_JSON_DECODER = json.JSONDecoder()
+
+# Retry hints in quota errors: "Please retry in 12.64s" or "retryDelay': '12s'"
+_RETRY_IN_RE = re.compile(r"retry in ([0-9]+(?:\.[0-9]+)?)s", re.IGNORECASE)
+_RETRY_DELAY_RE = re.compile(r"retrydelay['\"]?:\s*['\"]?([0-9]+(?:\.[0-9]+)?)s", re.IGNORECASE)
+
+# Stack frame paths: Node "(/path/file.js:line:col)" and Python 'File "/path/file.py", line X'
+_JS_STACK_RE = re.compile(r'\(([^)]+?\.(?:js|ts|jsx|tsx)):\d+:\d+\)')
+_PY_STACK_RE = re.compile(r'File [\'"](.+?\.(?:py|js|ts|jsx|tsx|go|rs|java))[\'"], line \d+')
+
+# Explicit file mentions anywhere in a log
+_FILE_MENTION_RE = re.compile(r'[\w\-/]+\.(?:html|css|js|ts|jsx|tsx|py|go|rs|java|json|env)', re.IGNORECASE)
+
+# Log markers for fallback file selection (one case-insensitive scan each,
+# without lowercasing a copy of the log)
+_CSP_MARKER_RE = re.compile(r"content security policy|csp", re.IGNORECASE)
+_SERVER_MARKER_RE = re.compile(
+    "|".join(map(re.escape, [
+        "node_modules",
+        "express",
+        "router",
+        "patherror",
+        "typeerror",
+        "referenceerror",
+        "stack trace",
+        "at ",
+    ])),
+    re.IGNORECASE,
+)
+_NOT_FOUND_MARKER_RE = re.compile(r"404|not found", re.IGNORECASE)
+
+# Questions about the project's structure ("how many files...", "where is the
+# config folder", "which file ...", "list the files ...") and the error shapes
+# that rule a question out. Code-location questions ("where is the login
+# route defined") need file contents, so they do not qualify.
+_STRUCTURE_NOUNS = r"(?:files?|folders?|director(?:y|ies)|modules?)"
+_QUESTION_RE = re.compile(
+    r"\s*(?:how many"
+    rf"|where (?:is|are)(?: the)?(?: \w+)? {_STRUCTURE_NOUNS}"
+    rf"|(?:which|what) {_STRUCTURE_NOUNS}"
+    rf"|(?:list|show me)(?: all)?(?: the)? {_STRUCTURE_NOUNS})\b",
+    re.IGNORECASE,
+)
+_ERROR_HINT_RE = re.compile(
+    r"Traceback \(most recent call last\)|\w(?:Error|Exception)\b|(?i:\berror:)|^\s+at |:\d+:\d+",
+    re.MULTILINE,
+)
+
+# Retry pacing: decorrelated jitter, capped, so parallel callers spread out
+_BACKOFF_BASE_SECONDS = 1.0
+_BACKOFF_CAP_SECONDS = 30.0
+_TRANSIENT_STATUS_CODES = frozenset({408, 500, 502, 503, 504})
+# Classifies errors without a status code in one case-insensitive pass; the
+# named group that matched says which kind of retryable error it is
+_RETRYABLE_ERROR_RE = re.compile(
+    r"(?P<quota>429|quota|rate limit|resource[ _]exhausted)|(?P<overloaded>503|unavailable|overloaded)",
+    re.IGNORECASE,
+)
+
+
+def _backoff_seconds(previous: float, retry_delay: float) -> float:
+    """Seconds to wait before the next attempt.
+
+    A delay the server asked for is used as-is. Otherwise this is decorrelated
+    jitter: each wait is drawn from [base, 3 * previous wait], so clients that
+    were throttled together drift apart instead of retrying in lockstep.
+
+    Args:
+        previous: The previous wait in seconds (0 before the first retry)
+        retry_delay: Delay advertised by the server, 0 if none
+    """
+    if retry_delay > 0:
+        return retry_delay
+    upper = max(previous, _BACKOFF_BASE_SECONDS) * 3
+    return min(_BACKOFF_CAP_SECONDS, random.uniform(_BACKOFF_BASE_SECONDS, upper))
+
+
+def _server_retry_delay(error: Exception, error_str: str) -> float:
+    """Retry delay from the response's Retry-After header, else from the error body."""
+    response = getattr(error, "response", None) if isinstance(error, genai_errors.APIError) else None
+    headers = getattr(response, "headers", None)
+    if headers:
+        try:
+            return max(0.0, float(headers.get("retry-after", "")))
+        except (TypeError, ValueError):
+            pass
+    return _extract_retry_delay_seconds(error_str)
+
 
 def _extract_retry_delay_seconds(error_str: str) -> float:
     """Extract retry delay in seconds from error messages if present."""
     if not error_str:
         return 0.0
-    # Examples: "Please retry in 12.64s" or "retryDelay': '12s'"
-    match = re.search(r"retry in ([0-9]+(?:\.[0-9]+)?)s", error_str, re.IGNORECASE)
+    match = _RETRY_IN_RE.search(error_str)
     if match:
         return float(match.group(1))
-    match = re.search(r"retrydelay['\"]?:\s*['\"]?([0-9]+)s", error_str, re.IGNORECASE)
+    match = _RETRY_DELAY_RE.search(error_str)
     if match:
         return float(match.group(1))
     return 0.0
@@ -82,16 +195,11 @@ class ActionType(str, Enum):
         """Parse action type from string, defaulting to PATCH for backward compatibility."""
         if value is None:
             return cls.PATCH
-        value_upper = str(value).upper().strip()
-        if value_upper == "ANSWER":
-            return cls.ANSWER
-        if value_upper == "INVESTIGATE":
-            return cls.INVESTIGATE
-        return cls.PATCH
+        # Member names match their values, so one dict probe replaces the if-chain
+        return cls._member_map_.get(str(value).upper().strip(), cls.PATCH)
 
 
-@dataclass
-@dataclass
+@dataclass(slots=True)
 class AdditionalFix:
     """An additional fix for another file."""
     filepath: str
@@ -99,7 +207,7 @@ class AdditionalFix:
     explanation: str
 
 
-@dataclass
+@dataclass(slots=True)
 class FixResult:
     """Result with root cause analysis and multiple fixes."""
     filepath: Optional[str]  # None for general system errors or ANSWER mode
@@ -155,26 +263,101 @@ class FixResult:
         """Get list of all files that need fixes."""
         if self.is_answer_only:
             return []
-        files = []
-        if self.filepath:
-            files.append(self.filepath)
-        if self.root_cause_file and self.root_cause_file not in files:
+        files = [self.filepath] if self.filepath else []
+        if self.root_cause_file:
             files.append(self.root_cause_file)
-        for fix in self.additional_fixes:
-            if fix.filepath not in files:
-                files.append(fix.filepath)
-        return files
+        files.extend(fix.filepath for fix in self.additional_fixes)
+        return list(dict.fromkeys(files))
+
+
+# Response schemas for the two steps. Docstrings are sent to the model as the
+# schema description; field order is the order the model writes fields in.
+class _InvestigateSchema(BaseModel):
+    """Files to read before patching."""
+    action_type: Literal["INVESTIGATE"]
+    thought: str = ""
+    files_to_read: List[str] = []
+
+
+class _AdditionalFixSchema(BaseModel):
+    """A fix for another file."""
+    filepath: str
+    full_code_block: str
+    explanation: str
+
+
+class _PatchSchema(BaseModel):
+    """A code patch or an answer."""
+    action_type: Literal["PATCH", "ANSWER"]
+    filepath: Optional[str] = None
+    full_code_block: str = ""
+    explanation: str = ""
+    root_cause_file: Optional[str] = None
+    root_cause_explanation: Optional[str] = None
+    additional_fixes: List[_AdditionalFixSchema] = []
+
 
+# Shared round-robin position; next() on itertools.count is atomic under the GIL
+_KEY_COUNTER = itertools.count()
 
-_KEY_INDEX = 0
 
+# Shared clients keep idle connections long enough to carry over between the
+# investigate and patch calls (httpx's default expiry is 5 s).
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30)
 
-def _get_client_for_key(api_key: str) -> genai.Client:
-    """Get configured Gemini client for a specific key."""
-    return genai.Client(api_key=api_key)
+
+@functools.lru_cache(maxsize=32)
+def _shared_client(api_key: str) -> genai.Client:
+    if "client_args" not in types.HttpOptions.model_fields:
+        return genai.Client(api_key=api_key)  # google-genai too old for transport options
+    return genai.Client(
+        api_key=api_key,
+        http_options=types.HttpOptions(client_args={"limits": _HTTP_LIMITS}),
+    )
 
 
-def _get_key_pool() -> list[str]:
+# Async connections belong to the event loop that opened them, so aio calls
+# get a client per (loop, key) instead of the process-wide one above
+_LOOP_CLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, genai.Client]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _loop_client(loop: asyncio.AbstractEventLoop, api_key: str) -> genai.Client:
+    clients = _LOOP_CLIENTS.get(loop)
+    if clients is None:
+        clients = {}
+        _LOOP_CLIENTS[loop] = clients
+    client = clients.get(api_key)
+    if client is None:
+        if "httpx_async_client" in types.HttpOptions.model_fields:
+            # A prebuilt httpx client pins aio calls to httpx; async_client_args
+            # would go to aiohttp when it is installed, and aiohttp rejects "limits"
+            client = genai.Client(api_key=api_key, http_options=types.HttpOptions(
+                httpx_async_client=httpx.AsyncClient(limits=_HTTP_LIMITS, follow_redirects=True),
+            ))
+        else:
+            client = genai.Client(api_key=api_key)
+        clients[api_key] = client
+    return client
+
+
+def _get_client(api_key: str) -> genai.Client:
+    """Get the Gemini client for a key, reusing its connection pool.
+
+    Inside a running event loop the client is specific to that loop.
+    Set ROMA_FRESH_CLIENT=1 to build a new client per call instead.
+    """
+    if _env_flag("ROMA_FRESH_CLIENT"):
+        return genai.Client(api_key=api_key)
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _shared_client(api_key)
+    return _loop_client(loop, api_key)
+
+
+def _get_key_pool() -> tuple[str, ...]:
     keys = get_api_keys()
     if not keys:
         raise RuntimeError(
@@ -184,6 +367,95 @@ def _get_key_pool() -> list[str]:
     return keys
 
 
+# Opt-in result cache for repeated errors (ROMA_LOG_CACHE=1)
+_RESULT_CACHE_SIZE = 512
+_RESULT_CACHE: "OrderedDict[str, FixResult]" = OrderedDict()
+_RESULT_CACHE_LOCK = threading.Lock()
+
+# Volatile log tokens that differ between otherwise identical errors
+_LOG_VOLATILE_RES = [
+    re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE),
+    re.compile(r"\b0x[0-9a-f]+\b", re.IGNORECASE),
+    re.compile(r"\b\d{4}-\d{2}-\d{2}[T ][\d:.]+Z?\b"),
+    re.compile(r"\b\d+\b"),
+]
+
+
+# Presentation-only differences: terminal colors and whitespace runs
+_ANSI_ESCAPE_RE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+_LOG_SPACE_RE = re.compile(r"[ \t]+")
+_LOG_BLANK_LINES_RE = re.compile(r"\s*\n\s*")
+
+
+def _normalize_log(log: str) -> str:
+    """Reduce a log to a template by masking ids, addresses, timestamps and numbers.
+
+    Colors and whitespace layout are dropped too, so a rerun piped through a
+    different terminal or re-indented by a log viewer maps to the same template.
+    """
+    log = _ANSI_ESCAPE_RE.sub("", log)
+    for pattern in _LOG_VOLATILE_RES:
+        log = pattern.sub("<*>", log)
+    log = _LOG_SPACE_RE.sub(" ", log)
+    return _LOG_BLANK_LINES_RE.sub("\n", log).strip()
+
+
+def _result_cache_keys(
+    log: str,
+    context: str,
+    project_root: Optional[str],
+    file_tree: Optional[str],
+    system_prompt_suffix: Optional[str],
+) -> Tuple[str, str]:
+    """Build the exact-match and template cache keys for an analysis.
+
+    The scope includes the (mtime, size) of each traceback file, so a cached
+    whole-file fix is not replayed after the file has been edited or patched.
+    """
+    root = project_root or os.getcwd()
+    stamps = []
+    for rel in _resolve_traceback_files(_extract_project_traceback_files(log, root), root):
+        try:
+            st = os.stat(os.path.join(root, rel))
+        except OSError:
+            stamps.append(f"{rel}:-")
+        else:
+            stamps.append(f"{rel}:{st.st_mtime_ns}:{st.st_size}")
+    scope = "\0".join([
+        project_root or "", file_tree or "", system_prompt_suffix or "", context or "", *stamps,
+    ])
+
+    def digest(kind: str, text: str) -> str:
+        return hashlib.sha256(f"{kind}\0{scope}\0{text}".encode("utf-8")).hexdigest()
+
+    return digest("exact", log), digest("template", _normalize_log(log))
+
+
+def _result_cache_get(keys: Tuple[str, ...]) -> Optional[FixResult]:
+    with _RESULT_CACHE_LOCK:
+        for key in keys:
+            result = _RESULT_CACHE.get(key)
+            if result is not None:
+                _RESULT_CACHE.move_to_end(key)
+                return result
+    return None
+
+
+def _result_cache_put(keys: Tuple[str, ...], result: FixResult) -> None:
+    with _RESULT_CACHE_LOCK:
+        for key in keys:
+            _RESULT_CACHE[key] = result
+            _RESULT_CACHE.move_to_end(key)
+        while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+
+
+def _next_api_key(keys: tuple[str, ...]) -> Tuple[int, str]:
+    """Pick the next key from the pool (round-robin, safe across threads)."""
+    index = next(_KEY_COUNTER) % len(keys)
+    return index, keys[index]
+
+
 def _normalize_filepath(filepath: Optional[str]) -> Optional[str]:
     """Normalize filepath, returning None for invalid/placeholder paths.
 
@@ -199,21 +471,10 @@ def _normalize_filepath(filepath: Optional[str]) -> Optional[str]:
     # Convert to string and strip whitespace
     filepath = str(filepath).strip()
 
-    # Check against known invalid placeholders
-    if filepath.lower() in INVALID_PATHS:
+    # Check against known invalid placeholders and placeholder patterns
+    if filepath.casefold() in _INVALID_PATHS_CF or _INVALID_PATH_RE.match(filepath):
         return None
 
-    # Check for placeholder patterns
-    placeholder_patterns = [
-        r"^path/to/",
-        r"^your[_-]",
-        r"^example[_-]?",
-        r"<.*>",  # <filename> style placeholders
-    ]
-    for pattern in placeholder_patterns:
-        if re.match(pattern, filepath, re.IGNORECASE):
-            return None
-
     return filepath
 
 
@@ -235,21 +496,29 @@ def _parse_json_response(text: str) -> dict:
     except json.JSONDecodeError:
         pass
 
-    # Try extracting from markdown code block
-    json_match = re.search(r'```(?:json)?\s*\n?(.*?)\n?```', text, re.DOTALL)
-    if json_match:
+    # Try the body of a markdown code block (JSON mode rarely emits fences)
+    body = text
+    if "```" in text:
+        fence = text.find("```")
+        newline = text.find("\n", fence)
+        start = newline + 1 if newline != -1 else fence + 3
+        end = text.rfind("```")
+        body = text[start:end] if end >= start else text[start:]
         try:
-            return json.loads(json_match.group(1))
+            return json.loads(body)
         except json.JSONDecodeError:
             pass
 
-    # Try finding JSON object in text
-    json_match = re.search(r'\{[\s\S]*\}', text)
-    if json_match:
-        try:
-            return json.loads(json_match.group(0))
-        except json.JSONDecodeError:
-            pass
+    # Decode the first object in the fenced body, then in the full text in
+    # case the JSON sits outside the fence; raw_decode stops where the object
+    # ends, so trailing prose needs no second scan
+    for candidate in ((body, text) if body is not text else (text,)):
+        brace = candidate.find("{")
+        if brace != -1:
+            try:
+                return _JSON_DECODER.raw_decode(candidate, brace)[0]
+            except json.JSONDecodeError:
+                pass
 
     raise ValueError(f"Could not parse JSON from response: {text[:200]}...")
 
@@ -299,6 +568,132 @@ def _sanitize_files_to_read(files_to_read: object) -> List[str]:
     return cleaned
 
 
+# Directories never worth indexing for path resolution
+_INDEX_SKIP_DIRS = frozenset({".git", "node_modules", "__pycache__", ".venv"})
+
+
+def _iter_project_files(
+    project_root: str,
+    dirs: Optional[List[Tuple[str, int]]] = None,
+) -> Iterator[Tuple[str, str]]:
+    """Yield (relpath, name) for project files, pruning skipped directories unopened.
+
+    When dirs is given, (directory, mtime_ns) is appended for each visited
+    directory, with the mtime taken before the directory is listed.
+    """
+    stack = [project_root]
+    while stack:
+        directory = stack.pop()
+        try:
+            mtime = os.stat(directory).st_mtime_ns if dirs is not None else 0
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        if dirs is not None:
+            dirs.append((directory, mtime))
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in _INDEX_SKIP_DIRS:
+                    subdirs.append(entry.path)
+            elif entry.is_file():
+                yield _normalize_relpath(os.path.relpath(entry.path, project_root)), entry.name
+        # Reverse so directories are visited in name order, like a top-down walk
+        stack.extend(reversed(subdirs))
+
+
+def _tree_signature(dirs: Tuple[str, ...]) -> int:
+    """Hash the current mtimes of a project's directories.
+
+    A directory's mtime changes whenever an entry is added, removed or renamed
+    in it (new subdirectories included, through their parent), so this changes
+    whenever the set of files does, at the cost of one stat per directory.
+    """
+    stamps = []
+    for directory in dirs:
+        try:
+            stamps.append(os.stat(directory).st_mtime_ns)
+        except OSError:
+            stamps.append(-1)
+    return hash(tuple(stamps))
+
+
+# ({basename: [relpaths]}, all relpaths)
+_ProjectIndex = Tuple[dict[str, List[str]], Tuple[str, ...]]
+# (visited directories, their signature, index)
+_IndexEntry = Tuple[Tuple[str, ...], int, _ProjectIndex]
+
+_INDEX_CACHE_SIZE = 4
+_PROJECT_INDEXES: "OrderedDict[str, _IndexEntry]" = OrderedDict()
+_PROJECT_INDEXES_LOCK = threading.Lock()
+
+
+def _build_project_index(project_root: str) -> _IndexEntry:
+    """Walk the project once, returning (directories, signature, index)."""
+    by_basename: dict[str, List[str]] = {}
+    rel_paths: List[str] = []
+    dirs: List[Tuple[str, int]] = []
+    for rel, name in _iter_project_files(project_root, dirs):
+        rel_paths.append(rel)
+        by_basename.setdefault(name, []).append(rel)
+    # Signed with the mtimes seen before each listing, so a file created
+    # mid-walk makes the next lookup rebuild
+    signature = hash(tuple(mtime for _, mtime in dirs))
+    return tuple(path for path, _ in dirs), signature, (by_basename, tuple(rel_paths))
+
+
+def _project_entry(project_root: str) -> _IndexEntry:
+    """Get the cached index entry for a root, rebuilding it if any directory changed."""
+    with _PROJECT_INDEXES_LOCK:
+        entry = _PROJECT_INDEXES.get(project_root)
+    if entry is None or _tree_signature(entry[0]) != entry[1]:
+        entry = _build_project_index(project_root)
+    with _PROJECT_INDEXES_LOCK:
+        _PROJECT_INDEXES[project_root] = entry
+        _PROJECT_INDEXES.move_to_end(project_root)
+        while len(_PROJECT_INDEXES) > _INDEX_CACHE_SIZE:
+            _PROJECT_INDEXES.popitem(last=False)
+    return entry
+
+
+def _project_index(project_root: str) -> _ProjectIndex:
+    """Get the file index for a project root."""
+    return _project_entry(os.path.realpath(project_root))[2]
+
+
+def _project_signature(project_root: str) -> int:
+    """Get a signature that changes whenever files are added or removed anywhere in the project."""
+    return _project_entry(project_root)[1]
+
+
+@functools.lru_cache(maxsize=8)
+def _cached_file_tree(project_root: str, signature: int) -> str:
+    from roma_debug.utils.context import generate_file_tree
+
+    return generate_file_tree(project_root)
+
+
+def _project_file_tree(project_root: str) -> str:
+    """Get the prompt file tree, reused until files are added or removed."""
+    project_root = os.path.realpath(project_root)
+    return _cached_file_tree(project_root, _project_signature(project_root))
+
+
+@functools.lru_cache(maxsize=4)
+def _cached_entry_points(project_root: str, signature: int) -> Tuple[str, ...]:
+    from roma_debug.tracing.project_scanner import ProjectScanner
+
+    info = ProjectScanner(project_root).scan()
+    return tuple(ep.path for ep in info.entry_points[:3])
+
+
+def _project_entry_points(project_root: str) -> Tuple[str, ...]:
+    """Get up to three project entry points, from a scan cached like the file tree."""
+    project_root = os.path.realpath(project_root)
+    return _cached_entry_points(project_root, _project_signature(project_root))
+
+
 def _resolve_requested_path(requested_path: str, project_root: str) -> Optional[str]:
     """Resolve a requested file path within the project root."""
     if not requested_path:
@@ -323,24 +718,73 @@ def _resolve_requested_path(requested_path: str, project_root: str) -> Optional[
     if not basename:
         return None
 
-    for root, _, files in os.walk(project_root):
-        if basename in files:
-            resolved = os.path.realpath(os.path.join(root, basename))
-            if resolved.startswith(project_root + os.sep):
-                return resolved
+    # Fall back to a basename lookup, preferring entries that share the most
+    # trailing path components with the request
+    requested_parts = _normalize_relpath(requested_path).split("/")[::-1]
+
+    def shared_tail(rel: str) -> int:
+        count = 0
+        for have, want in zip(rel.split("/")[::-1], requested_parts):
+            if have != want:
+                break
+            count += 1
+        return count
+
+    by_basename, _ = _project_index(project_root)
+    matches = sorted(by_basename.get(basename, ()), key=shared_tail, reverse=True)
+    for rel in matches:
+        resolved = os.path.realpath(os.path.join(project_root, rel))
+        if resolved.startswith(project_root + os.sep) and os.path.isfile(resolved):
+            return resolved
 
     return None
 
 
+# Read budgets for requested files (per file and per investigation)
+DEFAULT_MAX_FILE_BYTES = 262144
+DEFAULT_MAX_TOTAL_BYTES = 1048576
+
+
+def _read_file_capped(path: str, max_bytes: int) -> str:
+    """Read a text file, keeping only its head and tail if it exceeds max_bytes."""
+    size = os.path.getsize(path)
+    if size <= max_bytes:
+        with open(path, "r", encoding="utf-8", errors="replace") as handle:
+            return handle.read()
+
+    half = max_bytes // 2
+    with open(path, "rb") as handle:
+        head = handle.read(half)
+        handle.seek(-half, os.SEEK_END)
+        tail = handle.read(half)
+    marker = f"\n... [truncated {size - 2 * half} bytes] ...\n"
+    text = head.decode("utf-8", errors="replace") + marker + tail.decode("utf-8", errors="replace")
+    # Same newline translation as the text-mode read above
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
 def _read_requested_files(
     files_to_read: List[str],
     project_root: str,
-) -> Tuple[List[Tuple[str, str]], List[str]]:
-    """Read requested files, returning (contents, missing)."""
+) -> Tuple[List[Tuple[str, str]], List[str], List[str]]:
+    """Read requested files, returning (contents, missing, skipped).
+
+    Paths are resolved in order and each file reserves its share of
+    ROMA_MAX_TOTAL_BYTES from its size on disk before anything is read, capped
+    at ROMA_MAX_FILE_BYTES and at what is left of the budget (larger files
+    keep their head and tail). Files that no longer fit are returned as
+    skipped, unopened, rather than missing, since they do exist. The files
+    that fit are then read concurrently.
+    """
     contents: List[Tuple[str, str]] = []
     missing: List[str] = []
+    skipped: List[str] = []
     seen: set[str] = set()
+    max_file_bytes = env_int("ROMA_MAX_FILE_BYTES", DEFAULT_MAX_FILE_BYTES)
+    max_total_bytes = env_int("ROMA_MAX_TOTAL_BYTES", DEFAULT_MAX_TOTAL_BYTES)
 
+    reserved = 0
+    to_read: List[Tuple[str, str, str, int]] = []
     for requested_path in files_to_read:
         resolved = _resolve_requested_path(requested_path, project_root)
         if not resolved:
@@ -352,15 +796,40 @@ def _read_requested_files(
         rel_path = os.path.relpath(resolved, project_root)
         if rel_path in seen:
             continue
+        seen.add(rel_path)
 
         try:
-            with open(resolved, "r", encoding="utf-8", errors="replace") as handle:
-                contents.append((rel_path, handle.read()))
-                seen.add(rel_path)
+            size = os.path.getsize(resolved)
+        except OSError:
+            missing.append(requested_path)
+            continue
+        remaining = max_total_bytes - reserved
+        if remaining <= 0:
+            skipped.append(requested_path)
+            continue
+        cap = min(max_file_bytes, remaining)
+        reserved += min(size, cap)
+        to_read.append((requested_path, resolved, rel_path, cap))
+
+    def read_one(item: Tuple[str, str, str, int]) -> Optional[str]:
+        try:
+            return _read_file_capped(item[1], item[3])
         except Exception:
+            return None
+
+    if len(to_read) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, len(to_read))) as pool:
+            texts = list(pool.map(read_one, to_read))
+    else:
+        texts = [read_one(item) for item in to_read]
+
+    for (requested_path, _, rel_path, _), text in zip(to_read, texts):
+        if text is None:
             missing.append(requested_path)
+        else:
+            contents.append((rel_path, text))
 
-    return contents, missing
+    return contents, missing, skipped
 
 
 def _normalize_relpath(path: str) -> str:
@@ -399,15 +868,8 @@ def _resolve_traceback_files(
 
         # Fallback: suffix match within project
         suffix = _normalize_relpath(path)
-        matches: List[str] = []
-        for root, _, files in os.walk(project_root):
-            for name in files:
-                rel = os.path.relpath(os.path.join(root, name), project_root)
-                rel_norm = _normalize_relpath(rel)
-                if rel_norm.endswith(suffix):
-                    matches.append(rel_norm)
-            if len(matches) > 1:
-                break
+        _, rel_paths = _project_index(project_root)
+        matches = [rel for rel in rel_paths if rel.endswith(suffix)]
 
         if len(matches) == 1:
             resolved.append(matches[0])
@@ -417,24 +879,44 @@ def _resolve_traceback_files(
     return list(dict.fromkeys(p for p in resolved if p))
 
 
-def _build_investigation_prompt(log: str, file_tree: str) -> str:
-    """Build the investigation prompt with error log and file tree."""
-    parts = [
-        "<ErrorLog>",
-        log,
-        "</ErrorLog>",
-        "",
-        "<TracebackFiles>",
-        "\n".join(_extract_traceback_files(log, os.getcwd())),
-        "</TracebackFiles>",
-        "",
-        "<ProjectStructure>",
-        "```",
-        file_tree,
-        "```",
-        "</ProjectStructure>",
-    ]
-    return "\n".join(parts)
+# A Python or JS frame line plus, optionally, the source line printed under it,
+# repeated back to back at least three times (deep recursion, retry loops).
+_REPEATED_FRAME_RE = re.compile(
+    r'^([ \t]*(?:File "|at ).*\n(?:(?![ \t]*(?:File "|at )).*\n)?)(?:\1){2,}',
+    re.MULTILINE,
+)
+_EXTRA_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+def _compact_log(log: str) -> str:
+    """Shrink a log for the prompt without losing information.
+
+    Runs of identical stack frames are collapsed to one frame plus a repeat
+    count, and runs of blank lines to a single blank line. Only the prompt
+    copy is compacted; traceback extraction still reads the raw log.
+    """
+
+    def collapse(match: "re.Match[str]") -> str:
+        frame = match.group(1)
+        repeats = len(match.group(0)) // len(frame) - 1
+        indent = frame[: len(frame) - len(frame.lstrip())]
+        return f"{frame}{indent}[Previous frame repeated {repeats} more times]\n"
+
+    log = _REPEATED_FRAME_RE.sub(collapse, log)
+    return _EXTRA_BLANK_LINES_RE.sub("\n\n", log)
+
+
+def _build_investigation_prompt(log: str, file_tree: str, traceback_files: List[str]) -> str:
+    """Build the investigation prompt with error log, traceback files and file tree."""
+    buf = io.StringIO()
+    buf.write("<ErrorLog>\n")
+    buf.write(log)
+    buf.write("\n</ErrorLog>\n\n<TracebackFiles>\n")
+    buf.write("\n".join(traceback_files))
+    buf.write("\n</TracebackFiles>\n\n<ProjectStructure>\n```\n")
+    buf.write(file_tree)
+    buf.write("\n```\n</ProjectStructure>")
+    return buf.getvalue()
 
 
 def _build_patch_prompt(
@@ -443,54 +925,45 @@ def _build_patch_prompt(
     file_contents: List[Tuple[str, str]],
     missing_files: List[str],
     fallback_context: Optional[str] = None,
+    skipped_files: Optional[List[str]] = None,
 ) -> str:
     """Build the patch/answer prompt with requested file contents."""
-    parts = [
-        "<ErrorLog>",
-        log,
-        "</ErrorLog>",
-        "",
-        "<ProjectStructure>",
-        "```",
-        file_tree,
-        "```",
-        "</ProjectStructure>",
-        "",
-    ]
+    # Written straight into one buffer so large file contents are copied once,
+    # not into a parts list and again by the final join.
+    buf = io.StringIO()
+    buf.write("<ErrorLog>\n")
+    buf.write(log)
+    buf.write("\n</ErrorLog>\n\n<ProjectStructure>\n```\n")
+    buf.write(file_tree)
+    buf.write("\n```\n</ProjectStructure>\n\n")
 
     if missing_files:
-        parts.extend([
-            "<MissingFiles>",
-            "\n".join(missing_files),
-            "</MissingFiles>",
-            "",
-        ])
+        buf.write("<MissingFiles>\n")
+        buf.write("\n".join(missing_files))
+        buf.write("\n</MissingFiles>\n\n")
+
+    if skipped_files:
+        buf.write("<SkippedFiles>\n(These files exist but were skipped: the read budget was used up.)\n")
+        buf.write("\n".join(skipped_files))
+        buf.write("\n</SkippedFiles>\n\n")
 
     if file_contents:
-        parts.append("<FileContents>")
+        buf.write("<FileContents>\n")
         for rel_path, content in file_contents:
-            parts.append(f"## {rel_path}")
-            parts.append("```")
-            parts.append(content)
-            parts.append("```")
-        parts.append("</FileContents>")
+            buf.write("## ")
+            buf.write(rel_path)
+            buf.write("\n```\n")
+            buf.write(content)
+            buf.write("\n```\n")
+        buf.write("</FileContents>")
     elif fallback_context:
-        parts.extend([
-            "<FileContents>",
-            "(No files were requested or resolved. Provided context follows.)",
-            "```",
-            fallback_context,
-            "```",
-            "</FileContents>",
-        ])
+        buf.write("<FileContents>\n(No files were requested or resolved. Provided context follows.)\n```\n")
+        buf.write(fallback_context)
+        buf.write("\n```\n</FileContents>")
     else:
-        parts.extend([
-            "<FileContents>",
-            "(No files were requested or resolved.)",
-            "</FileContents>",
-        ])
+        buf.write("<FileContents>\n(No files were requested or resolved.)\n</FileContents>")
 
-    return "\n".join(parts)
+    return buf.getvalue()
 
 
 def _extract_traceback_files(log: str, project_root: str) -> List[str]:
@@ -498,11 +971,11 @@ def _extract_traceback_files(log: str, project_root: str) -> List[str]:
     candidates: List[str] = []
 
     # Node/JS stack traces: at ... (/path/file.js:line:col)
-    for match in re.findall(r'\(([^)]+?\.(?:js|ts|jsx|tsx)):\d+:\d+\)', log):
+    for match in _JS_STACK_RE.findall(log):
         candidates.append(match)
 
     # Python tracebacks: File "/path/file.py", line X
-    for match in re.findall(r'File [\'"](.+?\.(?:py|js|ts|jsx|tsx|go|rs|java))[\'"], line \d+', log):
+    for match in _PY_STACK_RE.findall(log):
         candidates.append(match)
 
     resolved: List[str] = []
@@ -547,10 +1020,22 @@ def _extract_project_traceback_files(log: str, project_root: str) -> List[str]:
     return list(dict.fromkeys(filtered))
 
 
+def _is_plain_question(log: str) -> bool:
+    """Whether the input is a short question the file tree alone can answer.
+
+    Questions naming a file still go through investigation so it gets read.
+    """
+    text = log.strip()
+    if not text or text.count("\n") > 2:
+        return False
+    if not _QUESTION_RE.match(text):
+        return False
+    return not (_ERROR_HINT_RE.search(text) or _FILE_MENTION_RE.search(text))
+
+
 def _fallback_files_to_read(log: str, project_root: str) -> List[str]:
     """Infer a minimal set of files to read when the model skips INVESTIGATE."""
     candidates: List[str] = []
-    log_lower = log.lower()
 
     # Use stack trace file paths if present
     for path in _extract_traceback_files(log, project_root):
@@ -558,44 +1043,24 @@ def _fallback_files_to_read(log: str, project_root: str) -> List[str]:
             candidates.append(path)
 
     # Extract explicit file mentions from the log
-    file_mentions = re.findall(
-        r'[\w\-/]+\.(?:html|css|js|ts|jsx|tsx|py|go|rs|java|json|env)',
-        log,
-        re.IGNORECASE,
-    )
-    for mention in file_mentions:
+    for mention in _FILE_MENTION_RE.findall(log):
         if mention not in candidates:
             candidates.append(mention)
 
     # CSP and browser console errors should inspect HTML
-    if "content security policy" in log_lower or "csp" in log_lower:
+    if _CSP_MARKER_RE.search(log):
         if "index.html" not in candidates:
             candidates.append("index.html")
 
     # If nothing explicit, use entry points for server-side errors
-    server_side_markers = [
-        "node_modules",
-        "express",
-        "router",
-        "patherror",
-        "typeerror",
-        "referenceerror",
-        "stack trace",
-        "at ",
-    ]
-    if not candidates and any(m in log_lower for m in server_side_markers):
+    if not candidates and _SERVER_MARKER_RE.search(log):
         try:
-            from roma_debug.tracing.project_scanner import ProjectScanner
-
-            scanner = ProjectScanner(project_root)
-            info = scanner.scan()
-            for ep in info.entry_points[:3]:
-                candidates.append(ep.path)
+            candidates.extend(_project_entry_points(project_root))
         except Exception:
             pass
 
     # Common frontend entry if HTTP/404 without explicit file
-    if not candidates and ("404" in log_lower or "not found" in log_lower):
+    if not candidates and _NOT_FOUND_MARKER_RE.search(log):
         candidates.append("index.html")
 
     return candidates[:5]
@@ -611,11 +1076,12 @@ def _merge_files_to_read(
     sources: dict[str, str] = {}
 
     def add_files(files: List[str], source: str) -> None:
+        # sources doubles as the seen-set: first source wins, order is kept in merged
         for path in files:
-            if path not in merged:
-                merged.append(path)
-            if path not in sources:
-                sources[path] = source
+            if path in sources:
+                continue
+            merged.append(path)
+            sources[path] = source
 
     add_files(model_files, "model")
     add_files(traceback_files, "traceback")
@@ -648,80 +1114,610 @@ def analyze_error(
     Raises:
         Exception: If Gemini API call fails after retries
     """
+    cache_keys, cached = _lookup_result_cache(log, context, project_root, file_tree, system_prompt_suffix)
+    if cached is not None:
+        return cached
+
+    steps = _analysis_steps(log, context, max_retries, project_root, file_tree, system_prompt_suffix)
+    try:
+        step = next(steps)
+        while True:
+            try:
+                value = _run_step_sync(step)
+            except Exception as e:
+                step = steps.throw(e)
+            else:
+                step = steps.send(value)
+    except StopIteration as done:
+        result = done.value
+
+    _store_result_cache(cache_keys, result)
+    return result
+
+
+async def analyze_error_async(
+    log: str,
+    context: str,
+    max_retries: int = 3,
+    include_upstream: bool = True,
+    project_root: Optional[str] = None,
+    file_tree: Optional[str] = None,
+    system_prompt_suffix: Optional[str] = None,
+) -> FixResult:
+    """Async variant of analyze_error using the Gemini aio client.
+
+    Takes the same arguments as analyze_error. Model calls and retry backoff
+    are awaited, so concurrent analyses overlap their network waits instead
+    of blocking the event loop.
+    """
+    cache_keys, cached = await asyncio.to_thread(
+        _lookup_result_cache, log, context, project_root, file_tree, system_prompt_suffix
+    )
+    if cached is not None:
+        return cached
+
+    steps = _analysis_steps(log, context, max_retries, project_root, file_tree, system_prompt_suffix)
+    async for item in _run_steps_async(steps, stream=False):
+        result = item
+
+    _store_result_cache(cache_keys, result)
+    return result
+
+
+async def analyze_error_stream(
+    log: str,
+    context: str,
+    max_retries: int = 3,
+    include_upstream: bool = True,
+    project_root: Optional[str] = None,
+    file_tree: Optional[str] = None,
+    system_prompt_suffix: Optional[str] = None,
+) -> AsyncIterator[Union[str, FixResult]]:
+    """Stream the patch response text as it arrives, then the final result.
+
+    Takes the same arguments as analyze_error. Yields raw text chunks from the
+    patch step (the JSON body, so callers can show progress before it is
+    complete) and finally the parsed FixResult. If a streamed attempt fails
+    and is retried, the retry's chunks follow the partial ones.
+    """
+    cache_keys, cached = await asyncio.to_thread(
+        _lookup_result_cache, log, context, project_root, file_tree, system_prompt_suffix
+    )
+    if cached is not None:
+        yield cached
+        return
+
+    steps = _analysis_steps(log, context, max_retries, project_root, file_tree, system_prompt_suffix)
+    async for item in _run_steps_async(steps, stream=True):
+        if isinstance(item, FixResult):
+            _store_result_cache(cache_keys, item)
+        yield item
+
+
+async def analyze_errors_batch(
+    pairs: List[Tuple[str, str]],
+    max_retries: int = 3,
+    include_upstream: bool = True,
+    project_root: Optional[str] = None,
+    file_tree: Optional[str] = None,
+    system_prompt_suffix: Optional[str] = None,
+) -> List[FixResult]:
+    """Analyze several (log, context) pairs concurrently.
+
+    Each pair runs through analyze_error_async; the calls share the pooled
+    clients and the limiter, so their network waits overlap without exceeding
+    the per-key rate or the concurrency cap.
+
+    Returns:
+        One FixResult per pair, in input order
+
+    Raises:
+        Exception: The first analysis failure, as asyncio.gather raises it
+    """
+    return list(await asyncio.gather(*(
+        analyze_error_async(
+            log,
+            context,
+            max_retries=max_retries,
+            include_upstream=include_upstream,
+            project_root=project_root,
+            file_tree=file_tree,
+            system_prompt_suffix=system_prompt_suffix,
+        )
+        for log, context in pairs
+    )))
+
+
+def _advance_steps(
+    steps: Generator["_Step", object, FixResult],
+    value: object = None,
+    error: Optional[Exception] = None,
+) -> Tuple[bool, object]:
+    """Resume the analysis steps, returning (finished, next step or result).
+
+    StopIteration is turned into a return value because it cannot cross a
+    thread pool future.
+    """
+    try:
+        if error is not None:
+            return False, steps.throw(error)
+        return False, steps.send(value)
+    except StopIteration as finished:
+        return True, finished.value
+
+
+async def _run_steps_async(
+    steps: Generator["_Step", object, FixResult],
+    stream: bool,
+) -> AsyncIterator[Union[str, FixResult]]:
+    """Drive the analysis steps on the aio client, yielding text chunks then the result."""
+    # Resuming the generator does the blocking work between model calls
+    # (file tree, project index, file reads, disk cache), so it runs in a
+    # worker thread; only the model calls and sleeps are awaited on the loop.
+    done, step = await asyncio.to_thread(_advance_steps, steps)
+    while not done:
+        try:
+            if stream and isinstance(step, _Generate) and step.stream:
+                parts = []
+                async with limiter.aslot(step.api_key):
+                    async for chunk in await step.client.aio.models.generate_content_stream(
+                        model=step.model,
+                        contents=step.contents,
+                        config=step.config,
+                    ):
+                        if chunk.text:
+                            parts.append(chunk.text)
+                            yield chunk.text
+                value = _TextResponse("".join(parts))
+            else:
+                value = await _run_step_async(step)
+        except Exception as e:
+            done, step = await asyncio.to_thread(_advance_steps, steps, error=e)
+        else:
+            done, step = await asyncio.to_thread(_advance_steps, steps, value)
+    yield step
+
+
+# Identical Gemini calls in flight at the same time (a retried request, two
+# panels analyzing the same log) share one request. Values are
+# concurrent.futures.Future so sync and async callers can wait on the same call.
+_INFLIGHT: dict[tuple, Tuple[Future, int]] = {}
+_INFLIGHT_LOCK = threading.Lock()
+
+
+def _inflight_key(step: "_Generate") -> tuple:
+    return (step.model, step.config.system_instruction, step.config.response_schema, step.contents)
+
+
+def _claim_inflight(step: "_Generate", blocking: bool) -> Tuple[tuple, Optional[Future], bool]:
+    """Return (key, future, leader); the leader makes the call and settles the future.
+
+    A blocking waiter never joins a call led from its own thread (an event loop
+    it would stall), so it gets no future and makes its own call.
+    """
+    key = _inflight_key(step)
+    with _INFLIGHT_LOCK:
+        entry = _INFLIGHT.get(key)
+        if entry is not None:
+            future, owner = entry
+            if blocking and owner == threading.get_ident():
+                return key, None, False
+            return key, future, False
+        future = Future()
+        _INFLIGHT[key] = (future, threading.get_ident())
+        return key, future, True
+
+
+def _settle_inflight(key: tuple, future: Future, response: object, error: Optional[BaseException]) -> None:
+    with _INFLIGHT_LOCK:
+        if _INFLIGHT.get(key, (None,))[0] is future:
+            del _INFLIGHT[key]
+    try:
+        if isinstance(error, Exception):
+            future.set_exception(error)
+        elif error is not None:
+            future.cancel()  # Interrupted or cancelled; waiters make their own call
+        else:
+            future.set_result(response)
+    except InvalidStateError:
+        pass
+
+
+def _run_step_sync(step: "_Step") -> object:
+    """Execute one analysis step with the blocking client."""
+    if isinstance(step, _Sleep):
+        time.sleep(step.seconds)
+        return None
+    if isinstance(step, _Race):
+        return _race_sync(step)
+
+    key, future, leader = _claim_inflight(step, blocking=True)
+    if future is not None and not leader:
+        try:
+            return future.result()
+        except CancelledError:
+            pass  # The leader was interrupted; make the call ourselves
+    try:
+        with limiter.slot(step.api_key):
+            response = step.client.models.generate_content(
+                model=step.model,
+                contents=step.contents,
+                config=step.config,
+            )
+    except BaseException as e:
+        if leader:
+            _settle_inflight(key, future, None, e)
+        raise
+    if leader:
+        _settle_inflight(key, future, response, None)
+    return response
+
+
+async def _run_step_async(step: "_Step") -> object:
+    """Execute one analysis step with the aio client."""
+    if isinstance(step, _Sleep):
+        await asyncio.sleep(step.seconds)
+        return None
+    if isinstance(step, _Race):
+        return await _race_async(step)
+
+    key, future, leader = _claim_inflight(step, blocking=False)
+    if not leader:
+        try:
+            # shield: cancelling this waiter must not cancel the shared call
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            if not future.cancelled():
+                raise
+    try:
+        async with limiter.aslot(step.api_key):
+            response = await step.client.aio.models.generate_content(
+                model=step.model,
+                contents=step.contents,
+                config=step.config,
+            )
+    except BaseException as e:
+        if leader:
+            _settle_inflight(key, future, None, e)
+        raise
+    if leader:
+        _settle_inflight(key, future, response, None)
+    return response
+
+
+def _race_sync(race: "_Race") -> Tuple["_Generate", object]:
+    """Run the raced calls on threads; the first JSON response wins."""
+    pool = ThreadPoolExecutor(max_workers=len(race.calls))
+    futures = {pool.submit(_run_step_sync, call): call for call in race.calls}
+    fallback = None
+    error: Optional[Exception] = None
+    try:
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if _is_json_response(response.text):
+                return futures[future], response
+            fallback = fallback or (futures[future], response)
+    finally:
+        # Losers keep running in the background; their results are dropped
+        pool.shutdown(wait=False, cancel_futures=True)
+    if fallback:
+        return fallback
+    raise error
+
+
+async def _race_async(race: "_Race") -> Tuple["_Generate", object]:
+    """Run the raced calls as tasks; the first JSON response wins, the rest are cancelled."""
+    tasks = {asyncio.ensure_future(_run_step_async(call)): call for call in race.calls}
+    pending = set(tasks)
+    fallback = None
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                response = task.result()
+                if _is_json_response(response.text):
+                    return tasks[task], response
+                fallback = fallback or (tasks[task], response)
+    finally:
+        for task in pending:
+            task.cancel()
+    if fallback:
+        return fallback
+    raise error
+
+
+def _lookup_result_cache(
+    log: str,
+    context: str,
+    project_root: Optional[str],
+    file_tree: Optional[str],
+    system_prompt_suffix: Optional[str],
+) -> Tuple[Optional[Tuple[str, str]], Optional[FixResult]]:
+    """Return (cache keys, cached result); keys are None when caching is off."""
+    if not _env_flag("ROMA_LOG_CACHE"):
+        return None, None
+    cache_keys = _result_cache_keys(log, context, project_root, file_tree, system_prompt_suffix)
+    return cache_keys, _result_cache_get(cache_keys)
+
+
+def _store_result_cache(cache_keys: Optional[Tuple[str, str]], result: FixResult) -> None:
+    # Only patches are cached; ANSWER results often depend on missing files
+    if cache_keys is not None and result.is_patch:
+        _result_cache_put(cache_keys, result)
+
+
+@dataclass
+class _Generate:
+    """A Gemini generate_content call requested by the analysis flow."""
+    api_key: str
+    model: str
+    contents: str
+    config: types.GenerateContentConfig
+    stream: bool = False  # Worth streaming to the caller (patch step)
+
+    @property
+    def client(self) -> genai.Client:
+        return _get_client(self.api_key)
+
+
+@dataclass
+class _TextResponse:
+    """Response text from a stream or the disk cache, shaped like a Gemini response."""
+    text: str
+
+
+@dataclass
+class _Sleep:
+    """A backoff pause requested by the analysis flow."""
+    seconds: float
+
+
+@dataclass
+class _Race:
+    """The same prompt sent to several models at once; first JSON reply wins."""
+    calls: List[_Generate]
+
+
+_Step = Union[_Generate, _Race, _Sleep]
+
+
+def _race_width() -> int:
+    """Number of models to race on the first attempt (ROMA_RACE_MODELS, default 1)."""
+    return max(1, env_int("ROMA_RACE_MODELS", 1))
+
+
+def _is_json_response(text: Optional[str]) -> bool:
+    if not text:
+        return False
+    try:
+        _parse_json_response(text)
+    except ValueError:
+        return False
+    return True
+
+
+@functools.lru_cache(maxsize=16)
+def _schema_fingerprint(schema: type) -> str:
+    return json.dumps(schema.model_json_schema(), sort_keys=True)
+
+
+def _config_fingerprint(config: types.GenerateContentConfig) -> str:
+    """Serialize the generation settings and response schema that shape a reply.
+
+    The system instruction is left out; it is keyed separately.
+    """
+    schema = config.response_schema
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        schema_text = _schema_fingerprint(schema)
+    elif isinstance(schema, BaseModel):
+        schema_text = schema.model_dump_json(exclude_none=True)
+    else:
+        schema_text = json.dumps(schema, sort_keys=True, default=str)
+    settings = config.model_dump(
+        mode="json",
+        exclude={"system_instruction", "response_schema", "http_options"},
+        exclude_none=True,
+    )
+    return json.dumps({"settings": settings, "schema": schema_text}, sort_keys=True, default=str)
+
+
+def _cached_response(step: _Generate) -> Tuple[Optional[str], Optional[_TextResponse]]:
+    """Return (disk cache key, cached response); the key is None when caching is off."""
+    if not _env_flag("ROMA_LLM_CACHE"):
+        return None, None
+    key = llm_cache.cache_key(
+        step.model,
+        step.contents,
+        step.config.system_instruction or "",
+        _config_fingerprint(step.config),
+    )
+    hit = llm_cache.get(key)
+    return key, (_TextResponse(hit["raw_text"]) if hit is not None else None)
+
+
+def _cache_response(key: Optional[str], response: object) -> None:
+    # Only keep responses that parse, so a malformed reply is not replayed
+    if key is not None and _is_json_response(response.text):
+        llm_cache.put(key, {"raw_text": response.text})
+
+
+def _generate(step: _Generate) -> Generator[_Step, object, object]:
+    """Yield a Gemini call, serving it from the on-disk cache when enabled."""
+    key, hit = _cached_response(step)
+    if hit is not None:
+        return hit
+
+    response = yield step
+    _cache_response(key, response)
+    return response
+
+
+def _race(race: _Race) -> Generator[_Step, object, Tuple[_Generate, object]]:
+    """Yield a model race, returning (winning call, response)."""
+    keys = {}
+    for call in race.calls:
+        key, hit = _cached_response(call)
+        if hit is not None:
+            return call, hit
+        keys[call.model] = key
+
+    winner, response = yield race
+    _cache_response(keys[winner.model], response)
+    return winner, response
+
+
+@functools.lru_cache(maxsize=8)
+def _step_configs(system_prompt: str) -> Tuple[types.GenerateContentConfig, types.GenerateContentConfig]:
+    """Build the (investigate, patch) configs for a system prompt, once per prompt.
+
+    Output is schema-constrained JSON; the system prompt goes in
+    system_instruction so it is a stable prefix across calls instead of part
+    of every prompt string. The configs are shared, so callers must not mutate them.
+    """
+    investigate_config = types.GenerateContentConfig(
+        temperature=0,
+        response_mime_type="application/json",
+        response_schema=_InvestigateSchema,
+        system_instruction=system_prompt,
+    )
+    patch_config = types.GenerateContentConfig(
+        temperature=0,
+        response_mime_type="application/json",
+        response_schema=_PatchSchema,
+        system_instruction=system_prompt,
+    )
+    return investigate_config, patch_config
+
+
+def _analysis_steps(
+    log: str,
+    context: str,
+    max_retries: int,
+    project_root: Optional[str],
+    file_tree: Optional[str],
+    system_prompt_suffix: Optional[str],
+) -> Generator[_Step, object, FixResult]:
+    """Run the investigate-then-patch flow, yielding each blocking step.
+
+    Gemini calls and backoff sleeps are yielded to the driver (sync or async),
+    which sends back the response or throws the call's exception in here.
+    """
     keys = _get_key_pool()
-    global _KEY_INDEX
-    debug_keys = os.environ.get("ROMA_DEBUG_KEYS", "").lower() in {"1", "true", "yes"}
+    debug_keys = _env_flag("ROMA_DEBUG_KEYS")
 
     project_root = project_root or os.getcwd()
     if file_tree is None:
-        from roma_debug.utils.context import generate_file_tree
-        file_tree = generate_file_tree(project_root)
+        file_tree = _project_file_tree(project_root)
     traceback_files = _extract_project_traceback_files(log, project_root)
     resolved_traceback_files = _resolve_traceback_files(traceback_files, project_root)
 
-    investigation_prompt = _build_investigation_prompt(log, file_tree)
+    prompt_log = _compact_log(log)
+    investigation_prompt = _build_investigation_prompt(prompt_log, file_tree, traceback_files)
     system_prompt = SYSTEM_PROMPT
     if system_prompt_suffix:
         system_prompt = f"{SYSTEM_PROMPT}\n\n{system_prompt_suffix}"
-    full_prompt = f"{system_prompt}\n\n{investigation_prompt}"
 
-    # Configure for JSON output
-    generation_config = types.GenerateContentConfig(
-        temperature=0,
-        response_mime_type="application/json",
+    investigate_config, patch_config = _step_configs(system_prompt)
+
+    # Skip the investigate call when every project traceback file exists locally
+    # (ROMA_FORCE_INVESTIGATE=1 restores the extra round-trip)
+    skip_investigation = (
+        bool(resolved_traceback_files)
+        and not _env_flag("ROMA_FORCE_INVESTIGATE")
+        and all(os.path.isfile(os.path.join(project_root, f)) for f in resolved_traceback_files)
+    )
+
+    # Plain questions are answered from the file tree in one call: the
+    # investigate step would only pick files the answer does not need
+    answer_from_tree = (
+        not traceback_files
+        and not _env_flag("ROMA_FORCE_INVESTIGATE")
+        and _is_plain_question(log)
     )
 
     models_to_try = _get_models_to_try()
+    race_models = models_to_try[:_race_width()]
     last_error = None
 
     for model_name in models_to_try:
+        backoff = 0.0
         for attempt in range(max_retries):
             try:
-                api_key = keys[_KEY_INDEX % len(keys)]
+                key_index, api_key = _next_api_key(keys)
                 if debug_keys:
-                    print(f"[ROMA] Using API key index {_KEY_INDEX % len(keys)}")
-                _KEY_INDEX += 1
-                client = _get_client_for_key(api_key)
-                response = client.models.generate_content(
-                    model=model_name,
-                    contents=full_prompt,
-                    config=generation_config,
-                )
-
-                raw_text = response.text
-
-                # Parse JSON response (investigation step)
-                try:
-                    parsed = _parse_json_response(raw_text)
-                except ValueError:
-                    parsed = {
-                        "action_type": "INVESTIGATE",
-                        "files_to_read": [],
-                        "thought": "AI returned non-JSON response. Raw output provided.",
-                    }
+                    print(f"[ROMA] Using API key index {key_index}")
+                used_model = model_name
+                if answer_from_tree:
+                    raw_text = ""
+                    action_type = ActionType.INVESTIGATE
+                    files_to_read, files_read_sources = [], {}
+                elif skip_investigation:
+                    # Traceback already names the files; go straight to the patch step
+                    raw_text = ""
+                    action_type = ActionType.INVESTIGATE
+                    files_to_read, files_read_sources = _merge_files_to_read(
+                        model_files=[],
+                        traceback_files=traceback_files,
+                        heuristic_files=[],
+                    )
+                else:
+                    if len(race_models) > 1 and model_name == race_models[0]:
+                        # Race the leading models (each on its own key); the winner
+                        # also handles the patch step
+                        calls = [_Generate(api_key, model_name, investigation_prompt, investigate_config)]
+                        for other in race_models[1:]:
+                            calls.append(_Generate(
+                                _next_api_key(keys)[1], other, investigation_prompt, investigate_config
+                            ))
+                        winner, response = yield from _race(_Race(calls))
+                        used_model, api_key = winner.model, winner.api_key
+                    else:
+                        response = yield from _generate(
+                            _Generate(api_key, model_name, investigation_prompt, investigate_config)
+                        )
 
-                action_type = _determine_action_type(parsed)
+                    raw_text = response.text
 
-                model_files: List[str] = []
-                if action_type == ActionType.INVESTIGATE:
-                    model_files = _sanitize_files_to_read(parsed.get("files_to_read"))
-                else:
-                    # Enforce investigate-first if the model skipped it
-                    model_files = _sanitize_files_to_read(parsed.get("files_to_read"))
-                    action_type = ActionType.INVESTIGATE
+                    # Parse JSON response (investigation step)
+                    try:
+                        parsed = _parse_json_response(raw_text)
+                    except ValueError:
+                        parsed = {
+                            "action_type": "INVESTIGATE",
+                            "files_to_read": [],
+                            "thought": "AI returned non-JSON response. Raw output provided.",
+                        }
 
-                heuristic_files: List[str] = []
-                if action_type == ActionType.INVESTIGATE and not model_files:
-                    heuristic_files = _fallback_files_to_read(log, project_root)
+                    action_type = _determine_action_type(parsed)
 
-                files_to_read, files_read_sources = _merge_files_to_read(
-                    model_files=model_files,
-                    traceback_files=traceback_files,
-                    heuristic_files=heuristic_files,
-                )
+                    model_files: List[str] = []
+                    if action_type == ActionType.INVESTIGATE:
+                        model_files = _sanitize_files_to_read(parsed.get("files_to_read"))
+                    else:
+                        # Enforce investigate-first if the model skipped it
+                        model_files = _sanitize_files_to_read(parsed.get("files_to_read"))
+                        action_type = ActionType.INVESTIGATE
+
+                    heuristic_files: List[str] = []
+                    if action_type == ActionType.INVESTIGATE and not model_files:
+                        heuristic_files = _fallback_files_to_read(log, project_root)
+
+                    files_to_read, files_read_sources = _merge_files_to_read(
+                        model_files=model_files,
+                        traceback_files=traceback_files,
+                        heuristic_files=heuristic_files,
+                    )
 
                 if action_type == ActionType.INVESTIGATE:
-                    if not files_to_read:
+                    if not files_to_read and not answer_from_tree:
                         files_to_read = _fallback_files_to_read(log, project_root)
                         files_to_read, files_read_sources = _merge_files_to_read(
                             model_files=[],
@@ -729,13 +1725,13 @@ def analyze_error(
                             heuristic_files=files_to_read,
                         )
 
-                    file_contents, missing_files = _read_requested_files(
+                    file_contents, missing_files, skipped_files = _read_requested_files(
                         files_to_read,
                         project_root,
                     )
                     files_read = [path for path, _ in file_contents]
 
-                    if not file_contents:
+                    if not file_contents and not answer_from_tree:
                         return FixResult(
                             filepath=None,
                             full_code_block="",
@@ -744,7 +1740,7 @@ def analyze_error(
                                 "No files were successfully read."
                             ),
                             raw_response=raw_text,
-                            model_used=model_name,
+                            model_used=used_model,
                             action_type=ActionType.ANSWER,
                             root_cause_file=None,
                             root_cause_explanation=None,
@@ -766,7 +1762,7 @@ def analyze_error(
                                     + ", ".join(unresolved)
                                 ),
                                 raw_response=raw_text,
-                                model_used=model_name,
+                                model_used=used_model,
                                 action_type=ActionType.ANSWER,
                                 root_cause_file=None,
                                 root_cause_explanation=None,
@@ -776,18 +1772,16 @@ def analyze_error(
                             )
 
                     patch_prompt = _build_patch_prompt(
-                        log=log,
+                        log=prompt_log,
                         file_tree=file_tree,
                         file_contents=file_contents,
                         missing_files=missing_files,
                         fallback_context=context,
+                        skipped_files=skipped_files,
                     )
-                    final_prompt = f"{system_prompt}\n\n{patch_prompt}"
 
-                    final_response = client.models.generate_content(
-                        model=model_name,
-                        contents=final_prompt,
-                        config=generation_config,
+                    final_response = yield from _generate(
+                        _Generate(api_key, used_model, patch_prompt, patch_config, stream=True)
                     )
 
                     raw_text = final_response.text
@@ -815,7 +1809,7 @@ def analyze_error(
                                 + (f" Requested: {', '.join(requested)}" if requested else "")
                             ),
                             raw_response=raw_text,
-                            model_used=model_name,
+                            model_used=used_model,
                             action_type=ActionType.ANSWER,
                             root_cause_file=None,
                             root_cause_explanation=None,
@@ -831,7 +1825,7 @@ def analyze_error(
                         full_code_block="",
                         explanation=parsed.get("explanation", ""),
                         raw_response=raw_text,
-                        model_used=model_name,
+                        model_used=used_model,
                         action_type=action_type,
                         root_cause_file=None,
                         root_cause_explanation=None,
@@ -860,7 +1854,7 @@ def analyze_error(
                     full_code_block=parsed.get("full_code_block", ""),
                     explanation=parsed.get("explanation", ""),
                     raw_response=raw_text,
-                    model_used=model_name,
+                    model_used=used_model,
                     action_type=action_type,
                     root_cause_file=root_cause_file,
                     root_cause_explanation=parsed.get("root_cause_explanation"),
@@ -870,25 +1864,25 @@ def analyze_error(
                 )
 
             except Exception as e:
-                error_str = str(e).lower()
+                error_str = str(e)
                 last_error = e
 
-                is_quota_error = any(x in error_str for x in [
-                    "429", "quota", "rate limit", "resource exhausted", "resource_exhausted"
-                ])
-                is_overloaded_error = any(x in error_str for x in [
-                    "503", "unavailable", "overloaded"
-                ])
+                status = e.code if isinstance(e, genai_errors.APIError) else None
+                kinds = {m.lastgroup for m in _RETRYABLE_ERROR_RE.finditer(error_str)}
+                is_quota_error = status == 429 or "quota" in kinds
+                is_overloaded_error = status in _TRANSIENT_STATUS_CODES or "overloaded" in kinds
 
+                # Anything else (bad key, bad request, ...) will not improve on retry
                 if is_quota_error or is_overloaded_error:
-                    retry_delay = _extract_retry_delay_seconds(error_str)
-                    if len(keys) > 1:
-                        if retry_delay > 0:
-                            time.sleep(retry_delay)
-                        continue
-                    wait_time = retry_delay or ((2 ** attempt) * 5)
+                    retry_delay = _server_retry_delay(e, error_str)
+                    if is_quota_error:
+                        # Steer other callers away from this key until it recovers
+                        limiter.penalize(api_key, retry_delay)
+                        if len(keys) > 1:
+                            continue  # Next attempt rotates to another key
                     if attempt < max_retries - 1:
-                        time.sleep(wait_time)
+                        backoff = _backoff_seconds(backoff, retry_delay)
+                        yield _Sleep(backoff)
                         continue
                     if model_name == PRIMARY_MODEL:
                         break  # Try fallback model
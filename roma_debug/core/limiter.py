@@ -0,0 +1,120 @@
+"""Client-side pacing for Gemini calls.
+
+Each API key gets a token bucket sized to its requests-per-minute quota
+(ROMA_RPM_PER_KEY, default 55), and the number of in-flight calls is capped
+(ROMA_MAX_CONCURRENCY, default 8). Pacing requests up front is cheaper than
+tripping a 429 and sleeping off the server's retry delay.
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Iterator
+
+from roma_debug.config import env_int
+
+
+DEFAULT_RPM_PER_KEY = 55
+DEFAULT_MAX_CONCURRENCY = 8
+
+
+def _env_count(name: str, default: int) -> int:
+    # Zero or negative counts would deadlock the semaphores and buckets
+    return max(1, env_int(name, default))
+
+
+class TokenBucket:
+    """Requests-per-minute bucket that hands out reservations instead of polling."""
+
+    def __init__(self, rpm: int):
+        self.capacity = float(rpm)
+        self.rate = rpm / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take one token, returning how many seconds to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def penalize(self, delay: float) -> None:
+        """Drain the bucket so the next reservation waits at least delay seconds."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 1 - delay * self.rate)
+
+
+_BUCKETS: dict[str, TokenBucket] = {}
+_BUCKETS_LOCK = threading.Lock()
+_THREAD_SLOTS = threading.BoundedSemaphore(_env_count("ROMA_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+_LOOP_SLOTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _bucket(key: str) -> TokenBucket:
+    with _BUCKETS_LOCK:
+        bucket = _BUCKETS.get(key)
+        if bucket is None:
+            bucket = TokenBucket(_env_count("ROMA_RPM_PER_KEY", DEFAULT_RPM_PER_KEY))
+            _BUCKETS[key] = bucket
+        return bucket
+
+
+def _loop_slots() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    slots = _LOOP_SLOTS.get(loop)
+    if slots is None:
+        slots = asyncio.Semaphore(_env_count("ROMA_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        _LOOP_SLOTS[loop] = slots
+    return slots
+
+
+@contextmanager
+def slot(key: str) -> Iterator[None]:
+    """Block until the key has quota and a concurrency slot is free.
+
+    Args:
+        key: API key the call will use
+    """
+    wait = _bucket(key).reserve()
+    if wait > 0:
+        time.sleep(wait)
+    with _THREAD_SLOTS:
+        yield
+
+
+@asynccontextmanager
+async def aslot(key: str) -> AsyncIterator[None]:
+    """Async counterpart of slot(); waits without blocking the event loop.
+
+    Args:
+        key: API key the call will use
+    """
+    wait = _bucket(key).reserve()
+    if wait > 0:
+        await asyncio.sleep(wait)
+    async with _loop_slots():
+        yield
+
+
+def penalize(key: str, delay: float) -> None:
+    """Hold back further calls on a key after the server rate-limited it.
+
+    Args:
+        key: API key that received the 429
+        delay: Seconds the server asked us to wait
+    """
+    if delay > 0:
+        _bucket(key).penalize(delay)
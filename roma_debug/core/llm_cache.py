@@ -0,0 +1,118 @@
+"""On-disk cache for Gemini responses.
+
+Analysis calls run at temperature 0, so the same (model, system, prompt,
+config) gives the same answer. Caching the raw response text lets repeat runs
+of an unchanged error skip the network round-trip entirely. Enabled with
+ROMA_LLM_CACHE=1; entries live under ~/.cache/roma_debug (or ROMA_CACHE_DIR).
+Entries already loaded in this process are kept in memory as well, so a
+repeat hit only costs a stat() rather than a file read and JSON parse.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Tuple
+
+
+DEFAULT_TTL_SECONDS = 86400
+MEMORY_ENTRIES = 256
+
+# entry path -> (file mtime, value); the mtime check keeps this in step with
+# the files on disk when entries expire, are rewritten or are cleared
+_MEMORY: "OrderedDict[Path, Tuple[float, dict]]" = OrderedDict()
+_MEMORY_LOCK = threading.Lock()
+
+
+def cache_dir() -> Path:
+    """Get the cache directory, honoring ROMA_CACHE_DIR and XDG_CACHE_HOME."""
+    override = os.environ.get("ROMA_CACHE_DIR")
+    if override:
+        return Path(override)
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "roma_debug"
+
+
+def cache_key(model: str, prompt: str, system: str = "", config: str = "") -> str:
+    """Build the content-addressed key for a model call.
+
+    Args:
+        model: Gemini model name
+        prompt: Prompt text sent as the call's contents
+        system: System instruction sent with the call
+        config: Stable serialization of the generation config and response
+            schema, so calls that would be shaped differently do not share
+            an entry
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    payload = json.dumps({"m": model, "p": prompt, "s": system, "c": config}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return cache_dir() / key[:2] / f"{key}.json"
+
+
+def _remember(path: Path, mtime: float, value: dict) -> None:
+    with _MEMORY_LOCK:
+        _MEMORY[path] = (mtime, value)
+        _MEMORY.move_to_end(path)
+        while len(_MEMORY) > MEMORY_ENTRIES:
+            _MEMORY.popitem(last=False)
+
+
+def get(key: str, ttl: float = DEFAULT_TTL_SECONDS) -> Optional[dict]:
+    """Load a cached entry if present and not older than ttl seconds.
+
+    Args:
+        key: Key from cache_key()
+        ttl: Maximum entry age in seconds
+
+    Returns:
+        The stored dict, or None on miss, expiry, or unreadable entry
+    """
+    path = _entry_path(key)
+    try:
+        mtime = path.stat().st_mtime
+        if time.time() - mtime > ttl:
+            return None
+        with _MEMORY_LOCK:
+            remembered = _MEMORY.get(path)
+            if remembered is not None and remembered[0] == mtime:
+                _MEMORY.move_to_end(path)
+                return remembered[1]
+        with open(path, "r", encoding="utf-8") as handle:
+            value = json.load(handle)
+    except (OSError, ValueError):
+        return None
+    _remember(path, mtime, value)
+    return value
+
+
+def put(key: str, value: dict) -> None:
+    """Store an entry atomically. Write failures are ignored.
+
+    Args:
+        key: Key from cache_key()
+        value: JSON-serializable dict
+    """
+    path = _entry_path(key)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                json.dump(value, handle)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        _remember(path, path.stat().st_mtime, value)
+    except OSError:
+        pass
@@ -4,9 +4,12 @@ This module provides enhanced data structures for multi-language support
 and deep debugging capabilities.
 """
 
+import io
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional, List, Any
+from operator import attrgetter
+from types import MappingProxyType
+from typing import Optional, List, Any, Mapping, Callable
 
 
 class Language(Enum):
@@ -34,37 +37,48 @@ class Language(Enum):
         Returns:
             Language enum value
         """
-        ext = ext.lower().lstrip(".")
-        mapping = {
-            "py": cls.PYTHON,
-            "pyw": cls.PYTHON,
-            "pyi": cls.PYTHON,
-            "js": cls.JAVASCRIPT,
-            "mjs": cls.JAVASCRIPT,
-            "cjs": cls.JAVASCRIPT,
-            "jsx": cls.JAVASCRIPT,
-            "ts": cls.TYPESCRIPT,
-            "tsx": cls.TYPESCRIPT,
-            "mts": cls.TYPESCRIPT,
-            "cts": cls.TYPESCRIPT,
-            "go": cls.GO,
-            "rs": cls.RUST,
-            "java": cls.JAVA,
-            "c": cls.C,
-            "h": cls.C,
-            "cpp": cls.CPP,
-            "cc": cls.CPP,
-            "cxx": cls.CPP,
-            "hpp": cls.CPP,
-            "hxx": cls.CPP,
-            "cs": cls.CSHARP,
-            "rb": cls.RUBY,
-            "php": cls.PHP,
-        }
-        return mapping.get(ext, cls.UNKNOWN)
-
-
-@dataclass
+        language = _EXT_TO_LANG.get(ext)
+        if language is None:
+            language = _EXT_TO_LANG.get(ext.lower().lstrip("."), cls.UNKNOWN)
+        return language
+
+
+_EXTENSIONS = {
+    "py": Language.PYTHON,
+    "pyw": Language.PYTHON,
+    "pyi": Language.PYTHON,
+    "js": Language.JAVASCRIPT,
+    "mjs": Language.JAVASCRIPT,
+    "cjs": Language.JAVASCRIPT,
+    "jsx": Language.JAVASCRIPT,
+    "ts": Language.TYPESCRIPT,
+    "tsx": Language.TYPESCRIPT,
+    "mts": Language.TYPESCRIPT,
+    "cts": Language.TYPESCRIPT,
+    "go": Language.GO,
+    "rs": Language.RUST,
+    "java": Language.JAVA,
+    "c": Language.C,
+    "h": Language.C,
+    "cpp": Language.CPP,
+    "cc": Language.CPP,
+    "cxx": Language.CPP,
+    "hpp": Language.CPP,
+    "hxx": Language.CPP,
+    "cs": Language.CSHARP,
+    "rb": Language.RUBY,
+    "php": Language.PHP,
+}
+
+# Extension -> Language, keyed with and without the leading dot so the common
+# lowercase ".py" / "py" lookups need no normalization
+_EXT_TO_LANG: Mapping[str, Language] = MappingProxyType({
+    **_EXTENSIONS,
+    **{f".{ext}": language for ext, language in _EXTENSIONS.items()},
+})
+
+
+@dataclass(slots=True)
 class Symbol:
     """A code symbol (function, method, class, etc.).
 
@@ -80,20 +94,36 @@ class Symbol:
     children: List["Symbol"] = field(default_factory=list)
     docstring: Optional[str] = None
     decorators: List[str] = field(default_factory=list)
+    _qualified_name: Optional[str] = field(default=None, init=False, repr=False, compare=False)
 
     @property
     def qualified_name(self) -> str:
-        """Get fully qualified name including parent chain."""
-        if self.parent:
-            return f"{self.parent.qualified_name}.{self.name}"
-        return self.name
+        """Get fully qualified name including parent chain.
+
+        Computed once and cached; call invalidate_qualified_name() after
+        changing name or parent.
+        """
+        if self._qualified_name is None:
+            if self.parent:
+                self._qualified_name = f"{self.parent.qualified_name}.{self.name}"
+            else:
+                self._qualified_name = self.name
+        return self._qualified_name
+
+    def invalidate_qualified_name(self) -> None:
+        """Drop the cached qualified name of this symbol and all its descendants."""
+        stack = [self]
+        while stack:
+            symbol = stack.pop()
+            symbol._qualified_name = None
+            stack.extend(symbol.children)
 
     def contains_line(self, line_number: int) -> bool:
         """Check if this symbol contains the given line number."""
         return self.start_line <= line_number <= self.end_line
 
 
-@dataclass
+@dataclass(slots=True)
 class Import:
     """Represents an import statement.
 
@@ -111,29 +141,50 @@ class Import:
     @property
     def full_import_string(self) -> str:
         """Reconstruct the import statement."""
-        if self.language == Language.PYTHON:
-            if self.imported_names:
-                prefix = "." * self.relative_level if self.is_relative else ""
-                return f"from {prefix}{self.module_name} import {', '.join(self.imported_names)}"
-            elif self.alias:
-                return f"import {self.module_name} as {self.alias}"
-            else:
-                return f"import {self.module_name}"
-        elif self.language in (Language.JAVASCRIPT, Language.TYPESCRIPT):
-            if self.imported_names:
-                return f"import {{ {', '.join(self.imported_names)} }} from '{self.module_name}'"
-            elif self.alias:
-                return f"import {self.alias} from '{self.module_name}'"
-            else:
-                return f"import '{self.module_name}'"
-        elif self.language == Language.GO:
-            if self.alias:
-                return f'import {self.alias} "{self.module_name}"'
-            return f'import "{self.module_name}"'
-        return f"import {self.module_name}"
+        return _IMPORT_FORMATTERS.get(self.language, _format_default_import)(self)
+
+
+def _format_python_import(imp: Import) -> str:
+    if imp.imported_names:
+        prefix = "." * imp.relative_level if imp.is_relative else ""
+        return f"from {prefix}{imp.module_name} import {', '.join(imp.imported_names)}"
+    if imp.alias:
+        return f"import {imp.module_name} as {imp.alias}"
+    return f"import {imp.module_name}"
+
 
+def _format_js_import(imp: Import) -> str:
+    if imp.imported_names:
+        return f"import {{ {', '.join(imp.imported_names)} }} from '{imp.module_name}'"
+    if imp.alias:
+        return f"import {imp.alias} from '{imp.module_name}'"
+    return f"import '{imp.module_name}'"
 
-@dataclass
+
+def _format_go_import(imp: Import) -> str:
+    if imp.alias:
+        return f'import {imp.alias} "{imp.module_name}"'
+    return f'import "{imp.module_name}"'
+
+
+def _format_default_import(imp: Import) -> str:
+    return f"import {imp.module_name}"
+
+
+# Language -> formatter, so full_import_string does one lookup per call
+_IMPORT_FORMATTERS: Mapping[Language, Callable[[Import], str]] = MappingProxyType({
+    Language.PYTHON: _format_python_import,
+    Language.JAVASCRIPT: _format_js_import,
+    Language.TYPESCRIPT: _format_js_import,
+    Language.GO: _format_go_import,
+})
+
+# Fields FileContext.to_dict() serializes for each import, fetched in one call
+_IMPORT_DICT_FIELDS = ("module_name", "alias", "imported_names", "resolved_path")
+_get_import_fields = attrgetter(*_IMPORT_DICT_FIELDS)
+
+
+@dataclass(slots=True, eq=False)
 class FileContext:
     """Extracted context from a source file.
 
@@ -162,19 +213,11 @@ class FileContext:
             "function_name": self.function_name,
             "class_name": self.class_name,
             "language": self.language.value,
-            "imports": [
-                {
-                    "module_name": imp.module_name,
-                    "alias": imp.alias,
-                    "imported_names": imp.imported_names,
-                    "resolved_path": imp.resolved_path,
-                }
-                for imp in self.imports
-            ],
+            "imports": [dict(zip(_IMPORT_DICT_FIELDS, _get_import_fields(imp))) for imp in self.imports],
         }
 
 
-@dataclass
+@dataclass(slots=True)
 class TraceFrame:
     """A single frame from a stack trace.
 
@@ -194,7 +237,7 @@ class TraceFrame:
         return "".join(parts)
 
 
-@dataclass
+@dataclass(slots=True)
 class ParsedTraceback:
     """A fully parsed traceback/stack trace.
 
@@ -216,16 +259,10 @@ class ParsedTraceback:
     @property
     def files(self) -> List[str]:
         """Get list of unique file paths from all frames."""
-        seen = set()
-        result = []
-        for frame in self.frames:
-            if frame.filepath not in seen:
-                seen.add(frame.filepath)
-                result.append(frame.filepath)
-        return result
+        return list(dict.fromkeys(frame.filepath for frame in self.frames))
 
 
-@dataclass
+@dataclass(slots=True)
 class UpstreamContext:
     """Context from upstream modules (imports and callers).
 
@@ -238,32 +275,38 @@ class UpstreamContext:
 
     def to_prompt_text(self) -> str:
         """Format upstream context for inclusion in AI prompt."""
-        parts = []
+        buf = io.StringIO()
+        w = buf.write
+
+        def section(text: str) -> None:
+            if buf.tell():
+                w("\n")
+            w(text)
 
         if self.call_chain:
-            parts.append("## CALL CHAIN")
-            parts.append(" -> ".join(self.call_chain))
+            section("## CALL CHAIN\n")
+            w(" -> ".join(self.call_chain))
 
         if self.relevant_definitions:
-            parts.append("\n## RELEVANT DEFINITIONS")
+            section("\n## RELEVANT DEFINITIONS")
             for symbol, code in self.relevant_definitions.items():
-                parts.append(f"\n### {symbol}")
-                parts.append(code)
+                w(f"\n\n### {symbol}\n")
+                w(code)
 
         if self.file_contexts:
-            parts.append("\n## UPSTREAM FILE CONTEXTS")
+            section("\n## UPSTREAM FILE CONTEXTS")
             for ctx in self.file_contexts:
-                parts.append(f"\n### {ctx.filepath}")
-                parts.append(ctx.content)
+                w(f"\n\n### {ctx.filepath}\n")
+                w(ctx.content)
 
         if self.dependency_summary:
-            parts.append("\n## DEPENDENCY SUMMARY")
-            parts.append(self.dependency_summary)
+            section("\n## DEPENDENCY SUMMARY\n")
+            w(self.dependency_summary)
 
-        return "\n".join(parts)
+        return buf.getvalue()
 
 
-@dataclass
+@dataclass(slots=True, eq=False)
 class AnalysisContext:
     """Complete context for AI analysis.
 
@@ -275,39 +318,51 @@ class AnalysisContext:
     parsed_traceback: Optional[ParsedTraceback] = None
     project_root: Optional[str] = None
     error_analysis: Optional[object] = None  # ErrorAnalysis from error_analyzer
+    # Traceback contexts outside the primary file, filtered once
+    secondary_contexts: List[FileContext] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Recompute secondary_contexts after changing the primary or traceback contexts."""
+        primary_path = self.primary_context.filepath
+        self.secondary_contexts = [
+            ctx for ctx in self.traceback_contexts if ctx.filepath != primary_path
+        ]
 
     def to_prompt_text(self) -> str:
         """Format complete context for AI prompt."""
-        parts = []
+        # Source bodies are written straight into one buffer instead of being
+        # collected in a list and copied again by a join
+        buf = io.StringIO()
+        w = buf.write
+        primary = self.primary_context
 
         # Primary error context
-        parts.append("## PRIMARY ERROR CONTEXT")
-        parts.append(f"File: {self.primary_context.filepath}")
-        parts.append(f"Line: {self.primary_context.line_number}")
-        if self.primary_context.function_name:
-            parts.append(f"Function: {self.primary_context.function_name}")
-        if self.primary_context.class_name:
-            parts.append(f"Class: {self.primary_context.class_name}")
-        parts.append(f"Language: {self.primary_context.language.value}")
-        parts.append("\n```")
-        parts.append(self.primary_context.content)
-        parts.append("```")
+        w(f"## PRIMARY ERROR CONTEXT\nFile: {primary.filepath}\nLine: {primary.line_number}")
+        if primary.function_name:
+            w(f"\nFunction: {primary.function_name}")
+        if primary.class_name:
+            w(f"\nClass: {primary.class_name}")
+        w(f"\nLanguage: {primary.language.value}\n\n```\n")
+        w(primary.content)
+        w("\n```")
 
         # Traceback contexts
         if self.traceback_contexts:
-            parts.append("\n## TRACEBACK CONTEXTS")
-            for ctx in self.traceback_contexts:
-                if ctx.filepath != self.primary_context.filepath:
-                    parts.append(f"\n### {ctx.filepath}:{ctx.line_number}")
-                    if ctx.function_name:
-                        parts.append(f"Function: {ctx.function_name}")
-                    parts.append("```")
-                    parts.append(ctx.content)
-                    parts.append("```")
+            w("\n\n## TRACEBACK CONTEXTS")
+            for ctx in self.secondary_contexts:
+                w(f"\n\n### {ctx.filepath}:{ctx.line_number}")
+                if ctx.function_name:
+                    w(f"\nFunction: {ctx.function_name}")
+                w("\n```\n")
+                w(ctx.content)
+                w("\n```")
 
         # Upstream context for deep debugging
         if self.upstream_context:
-            parts.append("\n## UPSTREAM CONTEXT (Deep Debugging)")
-            parts.append(self.upstream_context.to_prompt_text())
+            w("\n\n## UPSTREAM CONTEXT (Deep Debugging)\n")
+            w(self.upstream_context.to_prompt_text())
 
-        return "\n".join(parts)
+        return buf.getvalue()
@@ -8,13 +8,16 @@ import difflib
 import select
 import os
 import shutil
+import stat
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 import click
 from rich.console import Console
 from rich.panel import Panel
 from rich.syntax import Syntax
+from rich.text import Text
 from rich.prompt import Confirm
 
 from roma_debug import __version__
@@ -66,6 +69,44 @@ def get_multiline_input(show_header: bool = True) -> str:
         console.print("[dim]Press Enter on an empty line when done:[/dim]")
         console.print()
 
+    if not sys.stdin.isatty():
+        # Piped input: take it all in one buffered read, blank lines included
+        try:
+            return sys.stdin.read().strip()
+        except KeyboardInterrupt:
+            console.print("\n[yellow]Cancelled.[/yellow]")
+            return ""
+
+    if os.name == "nt":
+        # select() only handles sockets on Windows
+        return _read_tty_lines()
+
+    buf = bytearray()
+    fd = sys.stdin.fileno()
+    try:
+        while True:
+            # Pasted logs arrive in large chunks; read whatever is available
+            # instead of going through input() once per line.
+            ready, _, _ = select.select([fd], [], [], 0.15)
+            if not ready:
+                # A blank line followed by a pause ends the input. Blank lines
+                # inside a paste are followed by more data and are kept.
+                if buf.endswith(b"\n\n") and buf.strip():
+                    break
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            buf += chunk
+    except KeyboardInterrupt:
+        console.print("\n[yellow]Cancelled.[/yellow]")
+        return ""
+
+    return buf.decode("utf-8", errors="replace").strip()
+
+
+def _read_tty_lines() -> str:
+    """Read lines with input() until an empty line (fallback without select)."""
     lines: list[str] = []
 
     while True:
@@ -78,14 +119,6 @@ def get_multiline_input(show_header: bool = True) -> str:
             return ""
 
         if line == "":
-            # If more input arrives immediately (e.g., pasted logs with blank lines),
-            # treat this as part of the log. Otherwise, end input.
-            if sys.stdin.isatty():
-                ready, _, _ = select.select([sys.stdin], [], [], 0.15)
-                if ready:
-                    lines.append("")
-                    continue
-
             if lines:
                 break
             continue
@@ -95,6 +128,7 @@ def get_multiline_input(show_header: bool = True) -> str:
     return "\n".join(lines).strip()
 
 
+@lru_cache(maxsize=16)
 def compute_diff(original: str, fixed: str, filepath: str) -> str:
     """Compute unified diff between original and fixed code.
 
@@ -106,18 +140,27 @@ def compute_diff(original: str, fixed: str, filepath: str) -> str:
     Returns:
         Unified diff string
     """
-    original_lines = original.splitlines(keepends=True)
-    fixed_lines = fixed.splitlines(keepends=True)
+    # Interned lines let unchanged lines in both versions share one object,
+    # so difflib's comparisons short-circuit on identity
+    original_lines = [sys.intern(line) for line in original.splitlines(keepends=True)]
+    fixed_lines = [sys.intern(line) for line in fixed.splitlines(keepends=True)]
 
+    # Content lines keep their own endings (so a change to the final newline
+    # still shows up); lineterm only ends the ---/+++/@@ header lines
     diff = difflib.unified_diff(
         original_lines,
         fixed_lines,
         fromfile=f"a/{filepath}",
         tofile=f"b/{filepath}",
-        lineterm=""
+        lineterm="\n"
     )
 
-    return "".join(diff)
+    # Only a file's last line can lack a line boundary (any that splitlines
+    # honors); mark it the way diff does so the next line starts fresh
+    return "".join(
+        line if line[-1:].splitlines() == [""] else f"{line}\n\\ No newline at end of file\n"
+        for line in diff
+    )
 
 
 def display_diff(diff_text: str):
@@ -134,17 +177,22 @@ def display_diff(diff_text: str):
     console.print("[bold]Proposed Changes:[/bold]")
     console.print()
 
+    # One styled Text for the whole diff renders in a single print call
+    text = Text()
     for line in diff_text.splitlines():
         if line.startswith("+++") or line.startswith("---"):
-            console.print(f"[bold]{line}[/bold]")
+            style = "bold"
         elif line.startswith("@@"):
-            console.print(f"[cyan]{line}[/cyan]")
+            style = "cyan"
         elif line.startswith("+"):
-            console.print(f"[green]{line}[/green]")
+            style = "green"
         elif line.startswith("-"):
-            console.print(f"[red]{line}[/red]")
+            style = "red"
         else:
-            console.print(line)
+            style = ""
+        text.append(line, style=style)
+        text.append("\n")
+    console.print(text, soft_wrap=True, end="")
 
     console.print()
 
@@ -278,6 +326,29 @@ def display_general_advice(result: FixResult):
     console.print("\n[dim]This is general advice. No file will be modified.[/dim]")
 
 
+def _read_text(path: str) -> str | None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        chunks = []
+        chunk = os.read(fd, st.st_size + 1)
+        while chunk:
+            chunks.append(chunk)
+            chunk = os.read(fd, 65536)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+    # Same newline handling as text-mode open()
+    return b"".join(chunks).decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+
+
 def read_file_content(filepath: str) -> str | None:
     """Read file content if it exists.
 
@@ -287,24 +358,11 @@ def read_file_content(filepath: str) -> str | None:
     Returns:
         File content or None if not readable
     """
-    # Try absolute path first
-    if os.path.isfile(filepath):
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
-        except (IOError, OSError):
-            return None
-
-    # Try relative to cwd
-    cwd_path = os.path.join(os.getcwd(), filepath)
-    if os.path.isfile(cwd_path):
-        try:
-            with open(cwd_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except (IOError, OSError):
-            return None
-
-    return None
+    # Try the path as given first, then relative to cwd
+    content = _read_text(filepath)
+    if content is None and not os.path.isabs(filepath):
+        content = _read_text(os.path.join(os.getcwd(), filepath))
+    return content
 
 
 def resolve_filepath(filepath: str) -> str:
@@ -584,6 +642,8 @@ def interactive_mode(language_hint: str | None = None):
             break
 
         if not error_log:
+            if not sys.stdin.isatty():
+                break  # Piped input is used up
             continue
 
         lines = error_log.splitlines()
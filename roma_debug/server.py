@@ -22,7 +22,7 @@ from pydantic import BaseModel
 
 from roma_debug import __version__
 from roma_debug.config import get_api_key_status
-from roma_debug.core.engine import analyze_error
+from roma_debug.core.engine import FixResult, analyze_error_async, analyze_error_stream
 from roma_debug.core.models import Language
 from roma_debug.utils.github_integration import GitHubManager
 
@@ -208,23 +208,7 @@ def _compute_diff(original: str, fixed: str, filepath: str) -> str:
     return "".join(diff)
 
 
-def _build_analysis_response(
-    log: str,
-    context: str,
-    project_root: Optional[str],
-    include_upstream: bool,
-    file_tree: Optional[str] = None,
-    system_prompt_suffix: Optional[str] = None,
-) -> AnalyzeResponse:
-    result = analyze_error(
-        log,
-        context,
-        include_upstream=include_upstream,
-        project_root=project_root,
-        file_tree=file_tree,
-        system_prompt_suffix=system_prompt_suffix,
-    )
-
+def _build_analysis_response(result: FixResult, project_root: Optional[str]) -> AnalyzeResponse:
     primary_diff = None
     if result.filepath and project_root:
         try:
@@ -291,16 +275,72 @@ async def _build_analysis_response_async(
     file_tree: Optional[str] = None,
     system_prompt_suffix: Optional[str] = None,
 ) -> AnalyzeResponse:
-    return await _run_blocking(
-        "analysis",
-        _build_analysis_response,
+    # The Gemini calls and their retry backoff are awaited on the event loop;
+    # the file tree, file reads and cache lookups between them run in worker
+    # threads (see _run_steps_async), as does the diff computation.
+    start = time.perf_counter()
+    logger.info("[async] start analysis")
+    try:
+        result = await analyze_error_async(
+            log,
+            context,
+            include_upstream=include_upstream,
+            project_root=project_root,
+            file_tree=file_tree,
+            system_prompt_suffix=system_prompt_suffix,
+        )
+    except Exception:
+        logger.exception("[async] error analysis")
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        logger.info(f"[async] end analysis in {elapsed:.2f}s")
+    return await _run_blocking("analysis_diffs", _build_analysis_response, result, project_root)
+
+
+# Matches the filepath field once it is complete in a partially streamed reply
+_STREAM_FILEPATH_RE = re.compile(r'"filepath"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+async def _stream_analysis_events(
+    log: str,
+    context: str,
+    project_root: Optional[str],
+    include_upstream: bool,
+    file_tree: Optional[str] = None,
+):
+    """Run a streamed analysis, yielding SSE status events and the final done event.
+
+    The patch response is consumed as it arrives, so the client learns which
+    file is being fixed before the full code block has been generated.
+    """
+    received: List[str] = []
+    announced = False
+    result = None
+    async for item in analyze_error_stream(
         log,
         context,
-        project_root,
-        include_upstream,
-        file_tree,
-        system_prompt_suffix,
-    )
+        include_upstream=include_upstream,
+        project_root=project_root,
+        file_tree=file_tree,
+    ):
+        if isinstance(item, FixResult):
+            result = item
+            continue
+        if announced:
+            continue
+        received.append(item)
+        match = _STREAM_FILEPATH_RE.search("".join(received))
+        if match:
+            announced = True
+            try:
+                filepath = json.loads(f'"{match.group(1)}"')
+            except ValueError:
+                filepath = match.group(1)
+            yield f"event: status\ndata: Writing fix for {filepath}...\n\n"
+
+    response = await _run_blocking("analysis_diffs", _build_analysis_response, result, project_root)
+    yield f"event: done\ndata: {json.dumps(response.dict())}\n\n"
 
 
 async def _build_context_async(
@@ -760,15 +800,14 @@ async def analyze_stream(request: AnalyzeRequest, http_request: Request):
                     logger.warning(f"Context building failed, using basic context: {e}")
 
             yield "event: status\ndata: Analyzing with Gemini...\n\n"
-            response = await _build_analysis_response_async(
+            async for event in _stream_analysis_events(
                 log=request.log,
                 context=context,
                 project_root=project_root,
                 include_upstream=request.include_upstream,
                 file_tree=file_tree,
-            )
-            payload = json.dumps(response.dict())
-            yield f"event: done\ndata: {payload}\n\n"
+            ):
+                yield event
         except HTTPException as e:
             yield f"event: error\ndata: {json.dumps({'detail': e.detail, 'status': e.status_code})}\n\n"
         except Exception as e:
@@ -825,15 +864,14 @@ async def github_analyze_stream(request: GithubAnalyzeRequest, http_request: Req
                 context = ""
 
             yield "event: status\ndata: Analyzing with Gemini...\n\n"
-            response = await _build_analysis_response_async(
+            async for event in _stream_analysis_events(
                 log=request.log,
                 context=context,
                 project_root=repo_path,
                 include_upstream=request.include_upstream,
                 file_tree=file_tree,
-            )
-            payload = json.dumps(response.dict())
-            yield f"event: done\ndata: {payload}\n\n"
+            ):
+                yield event
         except HTTPException as e:
             yield f"event: error\ndata: {json.dumps({'detail': e.detail, 'status': e.status_code})}\n\n"
         except Exception as e:
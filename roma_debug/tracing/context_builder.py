@@ -6,6 +6,7 @@ Includes project scanning for deep project awareness.
 """
 
 import os
+import re
 from pathlib import Path
 from typing import Optional, List, Tuple
 
@@ -22,6 +23,41 @@ from roma_debug.tracing.project_scanner import ProjectScanner, ProjectInfo
 from roma_debug.tracing.error_analyzer import ErrorAnalyzer, ErrorAnalysis
 
 
+# Static sections of the deep-context prompt, joined once at import
+_FILE_TREE_HEADER = "\n".join([
+    "## PROJECT FILE TREE",
+    "IMPORTANT: Use this tree to verify file paths before suggesting changes.",
+    "- Do NOT assume a file exists unless you see it in this tree.",
+    "- If a file is MISSING from an expected location, look for it elsewhere in the tree.",
+    "- When suggesting fixes for 'file not found' errors, use this tree to find the actual file location.",
+    "",
+])
+
+_DEEP_CONTEXT_INSTRUCTIONS = "\n".join([
+    "## INSTRUCTIONS",
+    "FIRST: Determine if this is a CODE ERROR or a QUESTION.",
+    "",
+    "If QUESTION (how many files, where is X, explain, list files, etc.):",
+    "- Set action_type to 'ANSWER'",
+    "- LOOK at the <ProjectStructure> file tree above to answer",
+    "- If the item EXISTS: Count/list it precisely from the tree",
+    "- If the item DOESN'T EXIST: Be helpful - say so AND suggest alternatives",
+    "  Example: 'No room/ folder, but these folders exist: src/, tests/, public/'",
+    "- Put your answer in the explanation field",
+    "- Set filepath to null and full_code_block to ''",
+    "- DO NOT write code - just read the tree and answer",
+    "",
+    "If CODE ERROR (traceback, exception, 'not working', crash, bug):",
+    "- Set action_type to 'PATCH'",
+    "- CHECK the <ProjectStructure> tree to verify paths exist",
+    "- Provide MINIMAL fixes - only address the actual error",
+    "- Do NOT add new features or improvements",
+])
+
+# File paths mentioned in an error log, for the existence check
+_ERROR_FILE_RE = re.compile(r'[/\w\-\.]+\.(?:html|js|ts|py|css|json)')
+
+
 class ContextBuilder:
     """Builds comprehensive context for AI-powered debugging.
 
@@ -561,10 +597,7 @@ class ContextBuilder:
             parts.append("")
 
         # Other traceback locations
-        other_contexts = [
-            ctx for ctx in analysis_context.traceback_contexts
-            if ctx.filepath != analysis_context.primary_context.filepath
-        ]
+        other_contexts = analysis_context.secondary_contexts
         if other_contexts:
             parts.append("## CALL STACK CONTEXT")
             for ctx in other_contexts:
@@ -616,12 +649,7 @@ class ContextBuilder:
 
         # FILE TREE - Critical for environmental awareness
         parts.append("<ProjectStructure>")
-        parts.append("## PROJECT FILE TREE")
-        parts.append("IMPORTANT: Use this tree to verify file paths before suggesting changes.")
-        parts.append("- Do NOT assume a file exists unless you see it in this tree.")
-        parts.append("- If a file is MISSING from an expected location, look for it elsewhere in the tree.")
-        parts.append("- When suggesting fixes for 'file not found' errors, use this tree to find the actual file location.")
-        parts.append("")
+        parts.append(_FILE_TREE_HEADER)
         file_tree = self.project_scanner.generate_file_tree(max_depth=5, max_files_per_dir=20)
         parts.append("```")
         parts.append(file_tree)
@@ -648,8 +676,7 @@ class ContextBuilder:
 
         # Check for file paths mentioned in error
         parts.append("## FILE EXISTENCE CHECK")
-        import re
-        file_paths = re.findall(r'[/\w\-\.]+\.(?:html|js|ts|py|css|json)', error_log)
+        file_paths = _ERROR_FILE_RE.findall(error_log)
         for fp in file_paths[:5]:
             full_path = self.project_root / fp.lstrip('/')
             exists = full_path.exists()
@@ -704,23 +731,6 @@ class ContextBuilder:
             parts.append("")
 
         # Instructions for AI
-        parts.append("## INSTRUCTIONS")
-        parts.append("FIRST: Determine if this is a CODE ERROR or a QUESTION.")
-        parts.append("")
-        parts.append("If QUESTION (how many files, where is X, explain, list files, etc.):")
-        parts.append("- Set action_type to 'ANSWER'")
-        parts.append("- LOOK at the <ProjectStructure> file tree above to answer")
-        parts.append("- If the item EXISTS: Count/list it precisely from the tree")
-        parts.append("- If the item DOESN'T EXIST: Be helpful - say so AND suggest alternatives")
-        parts.append("  Example: 'No room/ folder, but these folders exist: src/, tests/, public/'")
-        parts.append("- Put your answer in the explanation field")
-        parts.append("- Set filepath to null and full_code_block to ''")
-        parts.append("- DO NOT write code - just read the tree and answer")
-        parts.append("")
-        parts.append("If CODE ERROR (traceback, exception, 'not working', crash, bug):")
-        parts.append("- Set action_type to 'PATCH'")
-        parts.append("- CHECK the <ProjectStructure> tree to verify paths exist")
-        parts.append("- Provide MINIMAL fixes - only address the actual error")
-        parts.append("- Do NOT add new features or improvements")
+        parts.append(_DEEP_CONTEXT_INSTRUCTIONS)
 
         return "\n".join(parts)
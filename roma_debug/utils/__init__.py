@@ -1,5 +1,17 @@
 """Utility modules for ROMA Debug."""
 
-from roma_debug.utils.context import get_file_context
-
 __all__ = ["get_file_context"]
+
+# Loaded on first access (PEP 562) so that importing a single utility module
+# does not import the parser registry.
+_LAZY = {"get_file_context": "roma_debug.utils.context"}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+
+        value = getattr(importlib.import_module(_LAZY[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,14 +1,43 @@
 """Tests for the engine module."""
 
+import asyncio
+import os
+import tempfile
+import threading
 import pytest
-from unittest.mock import patch, MagicMock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, AsyncMock, MagicMock
 import json
 
+from google.genai import errors as genai_errors
+
 from roma_debug.core.engine import (
+    AdditionalFix,
     analyze_error,
+    analyze_error_async,
+    analyze_error_stream,
+    analyze_errors_batch,
     _parse_json_response,
     _normalize_filepath,
     _determine_action_type,
+    _get_client,
+    _backoff_seconds,
+    _server_retry_delay,
+    _claim_inflight,
+    _compact_log,
+    _config_fingerprint,
+    _Generate,
+    _run_step_async,
+    _run_step_sync,
+    _step_configs,
+    _is_plain_question,
+    _next_api_key,
+    _normalize_log,
+    _result_cache_keys,
+    _read_requested_files,
+    _resolve_requested_path,
+    _resolve_traceback_files,
     FixResult,
     ActionType,
 )
@@ -43,6 +72,21 @@ class TestParseJsonResponse:
 
         assert result["filepath"] == "test.py"
 
+    def test_parses_json_surrounded_by_prose(self):
+        """Test parsing the first JSON object when text precedes and follows it."""
+        text = 'Here is the fix: {"filepath": "test.py", "explanation": "a } b"} Hope that helps {.'
+        result = _parse_json_response(text)
+
+        assert result["explanation"] == "a } b"
+
+    def test_parses_json_outside_code_fence(self):
+        """Test JSON before or after an unrelated code fence is still found."""
+        before = '{"a": 1}\nUse x like ```py\nx()\n```'
+        after = 'Here:\n```python\nprint(1)\n```\n{"filepath": "a.py"}'
+
+        assert _parse_json_response(before) == {"a": 1}
+        assert _parse_json_response(after) == {"filepath": "a.py"}
+
     def test_raises_on_invalid_json(self):
         """Test that invalid JSON raises ValueError."""
         text = "This is not JSON at all"
@@ -154,6 +198,423 @@ class TestFixResult:
         assert answer_result.is_answer_only is True
         assert answer_result.is_patch is False
 
+    def test_all_files_to_fix_dedupes_in_order(self):
+        """Test all_files_to_fix lists each file once, primary first."""
+        result = FixResult(
+            filepath="a.py",
+            full_code_block="code",
+            explanation="fix",
+            raw_response="{}",
+            model_used="gemini",
+            root_cause_file="b.py",
+            additional_fixes=[
+                AdditionalFix(filepath="a.py", full_code_block="", explanation=""),
+                AdditionalFix(filepath="c.py", full_code_block="", explanation=""),
+                AdditionalFix(filepath="b.py", full_code_block="", explanation=""),
+            ],
+        )
+
+        assert result.all_files_to_fix == ["a.py", "b.py", "c.py"]
+
+
+class TestNextApiKey:
+    """Tests for API key rotation."""
+
+    def test_rotates_through_pool(self):
+        """Test keys are handed out round-robin."""
+        keys = ["a", "b", "c"]
+        picked = [_next_api_key(keys)[1] for _ in range(6)]
+
+        assert sorted(picked[:3]) == keys
+        assert picked[3:] == picked[:3]
+
+
+class TestNormalizeLog:
+    """Tests for log template normalization."""
+
+    def test_masks_volatile_tokens(self):
+        """Test line numbers, addresses and timestamps are masked."""
+        a = '2024-01-02T10:11:12Z File "app.py", line 12, in run (obj at 0x7f3a)'
+        b = '2024-03-04T01:02:03Z File "app.py", line 40, in run (obj at 0x1bc2)'
+
+        assert _normalize_log(a) == _normalize_log(b)
+        assert "app.py" in _normalize_log(a)
+
+    def test_ignores_colors_and_layout(self):
+        """Test ANSI colors and whitespace layout do not change the template."""
+        plain = 'File "app.py", line 3\nKeyError: x'
+        colored = '\x1b[31m  File "app.py",   line 9\x1b[0m\n\n  KeyError: x  \n'
+
+        assert _normalize_log(plain) == _normalize_log(colored)
+
+    def test_keeps_distinct_errors_apart(self):
+        """Test different error messages produce different templates."""
+        assert _normalize_log("KeyError: 'user'") != _normalize_log("KeyError: 'id'")
+
+
+class TestResultCacheKeys:
+    """Tests for the repeated-error result cache keys."""
+
+    def test_keys_change_when_traceback_file_changes(self):
+        """Test editing a traceback file invalidates cached whole-file fixes."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "app.py")
+            with open(path, "w") as f:
+                f.write("x = 1\n")
+            log = f'File "{path}", line 1, in <module>\nNameError: y'
+
+            before = _result_cache_keys(log, "", tmpdir, "", None)
+            assert _result_cache_keys(log, "", tmpdir, "", None) == before
+
+            with open(path, "w") as f:
+                f.write("x = 1\ny = 2\n")
+
+            after = _result_cache_keys(log, "", tmpdir, "", None)
+            assert after[0] != before[0]
+            assert after[1] != before[1]
+
+
+class TestCompactLog:
+    """Tests for prompt-side log compaction."""
+
+    def test_collapses_repeated_frames(self):
+        """Test identical back-to-back frames collapse to one plus a count."""
+        frame = '  File "app.py", line 3, in f\n    return f(n)\n'
+        log = "Traceback (most recent call last):\n" + frame * 50 + "RecursionError: boom\n"
+
+        compacted = _compact_log(log)
+
+        assert compacted.count('File "app.py"') == 1
+        assert "[Previous frame repeated 49 more times]" in compacted
+        assert compacted.endswith("RecursionError: boom\n")
+
+    def test_leaves_distinct_frames_alone(self):
+        """Test logs without repeats are unchanged."""
+        log = 'File "a.py", line 1\nFile "b.py", line 2\nFile "a.py", line 1\nValueError\n'
+
+        assert _compact_log(log) == log
+
+    def test_collapses_blank_line_runs(self):
+        """Test runs of blank lines shrink to one blank line."""
+        assert _compact_log("a\n\n\n\nb") == "a\n\nb"
+
+
+class TestConfigFingerprint:
+    """Tests for the generation-config part of the LLM cache key."""
+
+    def test_differs_per_schema_and_settings(self):
+        """Test the schema and the sampling settings both change the fingerprint."""
+        investigate_config, patch_config = _step_configs("system")
+        warmer = patch_config.model_copy(update={"temperature": 0.7})
+
+        assert _config_fingerprint(patch_config) == _config_fingerprint(_step_configs("system")[1])
+        assert _config_fingerprint(investigate_config) != _config_fingerprint(patch_config)
+        assert _config_fingerprint(warmer) != _config_fingerprint(patch_config)
+
+
+class TestIsPlainQuestion:
+    """Tests for detecting questions that need no investigation."""
+
+    def test_detects_project_questions(self):
+        """Test short structure questions are recognized."""
+        assert _is_plain_question("How many files are in src?")
+        assert _is_plain_question("where are the config files")
+        assert _is_plain_question("Which file defines the User model?")
+        assert _is_plain_question("list all the directories under src")
+
+    def test_rejects_errors_and_file_questions(self):
+        """Test error logs and questions naming a file are not short-circuited."""
+        assert not _is_plain_question("TypeError: x is undefined")
+        assert not _is_plain_question("explain this error: ValueError bad")
+        assert not _is_plain_question("What is in config.py?")
+
+    def test_rejects_bug_reports_phrased_as_questions(self):
+        """Test only structure questions qualify, not anything ending in '?'."""
+        assert not _is_plain_question("list index out of range")
+        assert not _is_plain_question("how do I fix the login bug?")
+        assert not _is_plain_question("why does checkout crash when the cart is empty?")
+        assert not _is_plain_question("Cannot GET /api/users?")
+
+    def test_rejects_code_location_questions(self):
+        """Test 'where is <code>' questions go through investigation."""
+        assert not _is_plain_question("where is the login route defined")
+        assert not _is_plain_question("Where are users validated?")
+
+
+class TestBackoffSeconds:
+    """Tests for retry backoff timing."""
+
+    def test_uses_server_retry_delay(self):
+        """Test an advertised retry delay is used as-is."""
+        assert _backoff_seconds(0, 12.0) == 12.0
+
+    def test_decorrelated_jitter_bounds(self):
+        """Test each wait stays between the base and three times the previous wait."""
+        assert 1.0 <= _backoff_seconds(0, 0.0) <= 3.0
+        assert 1.0 <= _backoff_seconds(4.0, 0.0) <= 12.0
+        assert _backoff_seconds(100.0, 0.0) <= 30.0
+
+    def test_reads_retry_after_header(self):
+        """Test a Retry-After header on the API error wins over the body."""
+        response = MagicMock(headers={"retry-after": "7"})
+        error = genai_errors.APIError(429, {"error": {"message": "retry in 2s"}}, response)
+
+        assert _server_retry_delay(error, str(error).lower()) == 7.0
+        assert _server_retry_delay(Exception("Retry in 2s"), "retry in 2s") == 2.0
+
+
+class TestInflightCoalescing:
+    """Tests for sharing identical in-flight Gemini calls."""
+
+    @patch('roma_debug.core.engine._get_client')
+    def test_concurrent_sync_calls_share_one_request(self, mock_get_client):
+        """Test a second identical call waits for the first instead of calling."""
+        started = threading.Event()
+        release = threading.Event()
+        response = MagicMock(text="{}")
+
+        def slow_generate(model, contents, config):
+            started.set()
+            release.wait(5)
+            return response
+
+        mock_client = MagicMock()
+        mock_client.models.generate_content.side_effect = slow_generate
+        mock_get_client.return_value = mock_client
+        step = _Generate("key", "model", "prompt", _step_configs("system")[0])
+
+        joined = threading.Event()
+
+        def claim(step, blocking):
+            claimed = _claim_inflight(step, blocking)
+            if not claimed[2]:
+                joined.set()
+            return claimed
+
+        with patch('roma_debug.core.engine._claim_inflight', side_effect=claim):
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                first = pool.submit(_run_step_sync, step)
+                started.wait(5)
+                second = pool.submit(_run_step_sync, step)
+                joined.wait(5)
+                release.set()
+                results = [first.result(5), second.result(5)]
+
+        assert results == [response, response]
+        assert mock_client.models.generate_content.call_count == 1
+
+    @patch('roma_debug.core.engine._get_client')
+    def test_concurrent_async_calls_share_one_request(self, mock_get_client):
+        """Test identical concurrent async calls make one request."""
+        async def slow_generate(model, contents, config):
+            await asyncio.sleep(0.01)
+            return MagicMock(text="{}")
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=slow_generate)
+        mock_get_client.return_value = mock_client
+        step = _Generate("key", "model", "prompt", _step_configs("system")[0])
+
+        async def run_both():
+            return await asyncio.gather(_run_step_async(step), _run_step_async(step))
+
+        first, second = asyncio.run(run_both())
+
+        assert first is second
+        assert mock_client.aio.models.generate_content.await_count == 1
+
+
+class _GenerateHandler(BaseHTTPRequestHandler):
+    """Keep-alive HTTP/1.1 stand-in for the generateContent endpoint."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": "ok"}]}}],
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestClientPools:
+    """Tests for the pooled Gemini clients."""
+
+    def test_async_client_survives_a_new_event_loop(self):
+        """Test two asyncio.run calls on the same key each get a working aio client."""
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _GenerateHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+        async def call():
+            response = await _get_client("pool-test-key").aio.models.generate_content(
+                model="gemini-test", contents="hi"
+            )
+            return response.text
+
+        try:
+            with patch.dict(os.environ, {"GOOGLE_GEMINI_BASE_URL": base_url}):
+                assert asyncio.run(call()) == "ok"
+                assert asyncio.run(call()) == "ok"
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestResolvePaths:
+    """Tests for resolving model and traceback paths against the project."""
+
+    def test_requested_path_falls_back_to_basename(self):
+        """Test a bare filename is found in a subdirectory."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(f"{tmpdir}/src/app")
+            with open(f"{tmpdir}/src/app/views.py", "w") as f:
+                f.write("x = 1\n")
+
+            resolved = _resolve_requested_path("views.py", tmpdir)
+
+            assert resolved == os.path.realpath(f"{tmpdir}/src/app/views.py")
+
+    def test_requested_path_prefers_matching_suffix(self):
+        """Test the entry whose path ends with the request wins among duplicates."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for sub in ("a", "b"):
+                os.makedirs(f"{tmpdir}/{sub}")
+                with open(f"{tmpdir}/{sub}/utils.py", "w") as f:
+                    f.write("x = 1\n")
+
+            resolved = _resolve_requested_path("pkg/b/utils.py", tmpdir)
+
+            assert resolved == os.path.realpath(f"{tmpdir}/b/utils.py")
+
+    def test_traceback_file_unique_suffix_match(self):
+        """Test a traceback path resolves to its unique project match."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(f"{tmpdir}/src/app")
+            with open(f"{tmpdir}/src/app/views.py", "w") as f:
+                f.write("x = 1\n")
+
+            resolved = _resolve_traceback_files(["app/views.py"], tmpdir)
+
+            assert resolved == ["src/app/views.py"]
+
+    def test_traceback_file_resolves_inside_build_output(self):
+        """Test build directories stay in the index for tracebacks that point there."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(f"{tmpdir}/build/lib/pkg")
+            with open(f"{tmpdir}/build/lib/pkg/core.py", "w") as f:
+                f.write("x = 1\n")
+
+            resolved = _resolve_traceback_files(["lib/pkg/core.py"], tmpdir)
+
+            assert resolved == ["build/lib/pkg/core.py"]
+
+    def test_index_sees_files_added_in_subdirectories(self):
+        """Test a file created next to an indexed one is found on the next lookup."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.makedirs(f"{tmpdir}/src")
+            with open(f"{tmpdir}/src/a.py", "w") as f:
+                f.write("x = 1\n")
+            assert _resolve_requested_path("a.py", tmpdir)
+            assert _resolve_requested_path("b.py", tmpdir) is None
+
+            with open(f"{tmpdir}/src/b.py", "w") as f:
+                f.write("y = 2\n")
+            # Force a visible mtime change on filesystems with coarse timestamps
+            later = os.stat(f"{tmpdir}/src").st_mtime + 5
+            os.utime(f"{tmpdir}/src", (later, later))
+
+            assert _resolve_requested_path("b.py", tmpdir) == os.path.realpath(f"{tmpdir}/src/b.py")
+
+
+class TestReadRequestedFiles:
+    """Tests for reading files requested during investigation."""
+
+    def test_large_file_keeps_head_and_tail(self):
+        """Test files over the per-file cap are truncated in the middle."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(f"{tmpdir}/big.py", "w") as f:
+                f.write("HEAD" + "x" * 1000 + "TAIL")
+
+            with patch.dict(os.environ, {"ROMA_MAX_FILE_BYTES": "100"}):
+                contents, missing, skipped = _read_requested_files(["big.py"], tmpdir)
+
+            text = contents[0][1]
+            assert text.startswith("HEAD")
+            assert text.endswith("TAIL")
+            assert "[truncated 908 bytes]" in text
+            assert missing == []
+            assert skipped == []
+
+    def test_truncated_file_translates_lone_carriage_returns(self):
+        """Test the truncated path converts newlines like a text-mode read."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(f"{tmpdir}/big.py", "wb") as f:
+                f.write(b"a\rb\r\n" + b"x" * 1000 + b"c\rd")
+
+            with patch.dict(os.environ, {"ROMA_MAX_FILE_BYTES": "100"}):
+                contents, _, _ = _read_requested_files(["big.py"], tmpdir)
+
+            text = contents[0][1]
+            assert "\r" not in text
+            assert text.startswith("a\nb\n")
+            assert text.endswith("c\nd")
+
+    def test_total_budget_reports_rest_skipped(self):
+        """Test files past the total budget are reported as skipped, not missing."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("a.py", "b.py"):
+                with open(f"{tmpdir}/{name}", "w") as f:
+                    f.write("x" * 50)
+
+            with patch.dict(os.environ, {"ROMA_MAX_TOTAL_BYTES": "40"}):
+                contents, missing, skipped = _read_requested_files(["a.py", "b.py"], tmpdir)
+
+            assert [path for path, _ in contents] == ["a.py"]
+            assert missing == []
+            assert skipped == ["b.py"]
+
+    def test_total_budget_counts_bytes(self):
+        """Test the total budget is counted in UTF-8 bytes, not characters."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("a.py", "b.py"):
+                with open(f"{tmpdir}/{name}", "w", encoding="utf-8") as f:
+                    f.write("é" * 30)
+
+            with patch.dict(os.environ, {"ROMA_MAX_TOTAL_BYTES": "50"}):
+                contents, _, skipped = _read_requested_files(["a.py", "b.py"], tmpdir)
+
+            assert [path for path, _ in contents] == ["a.py"]
+            assert skipped == ["b.py"]
+
+    def test_over_budget_files_are_never_opened(self):
+        """Test the budget is reserved from file sizes before any file is read."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("a.py", "b.py", "c.py"):
+                with open(f"{tmpdir}/{name}", "w") as f:
+                    f.write("x" * 100)
+
+            with patch.dict(os.environ, {"ROMA_MAX_TOTAL_BYTES": "150"}):
+                with patch(
+                    "roma_debug.core.engine._read_file_capped",
+                    side_effect=lambda path, max_bytes: "x" * min(100, max_bytes),
+                ) as mock_read:
+                    contents, missing, skipped = _read_requested_files(["a.py", "b.py", "c.py"], tmpdir)
+
+            read_paths = sorted(os.path.basename(call.args[0]) for call in mock_read.call_args_list)
+            assert read_paths == ["a.py", "b.py"]
+            assert sorted(call.args[1] for call in mock_read.call_args_list) == [50, 150]
+            assert [path for path, _ in contents] == ["a.py", "b.py"]
+            assert missing == []
+            assert skipped == ["c.py"]
+
 
 class TestAnalyzeError:
     """Tests for analyze_error function with mocked API."""
@@ -162,7 +623,7 @@ class TestAnalyzeError:
     @patch('roma_debug.core.engine._get_client')
     def test_returns_fix_result(self, mock_get_client, mock_read_files):
         """Test that analyze_error returns a FixResult."""
-        mock_read_files.return_value = ([("test.py", "print('x')")], [])
+        mock_read_files.return_value = ([("test.py", "print('x')")], [], [])
         mock_client = MagicMock()
         mock_response_investigate = MagicMock()
         mock_response_investigate.text = json.dumps({
@@ -191,7 +652,7 @@ class TestAnalyzeError:
     @patch('roma_debug.core.engine._get_client')
     def test_handles_null_filepath(self, mock_get_client, mock_read_files):
         """Test handling of null filepath in response."""
-        mock_read_files.return_value = ([("test.py", "print('x')")], [])
+        mock_read_files.return_value = ([("test.py", "print('x')")], [], [])
         mock_client = MagicMock()
         mock_response_investigate = MagicMock()
         mock_response_investigate.text = json.dumps({
@@ -213,3 +674,294 @@ class TestAnalyzeError:
         result = analyze_error("400 API key invalid", "")
 
         assert result.filepath is None
+
+    @patch('roma_debug.core.engine.limiter.penalize')
+    @patch('roma_debug.core.engine.time.sleep')
+    @patch('roma_debug.core.engine._read_requested_files')
+    @patch('roma_debug.core.engine._get_client')
+    def test_retries_after_quota_error(self, mock_get_client, mock_read_files, mock_sleep, mock_penalize):
+        """Test that a rate-limit error is retried after backing off."""
+        mock_read_files.return_value = ([("test.py", "print('x')")], [], [])
+        mock_client = MagicMock()
+        mock_response_investigate = MagicMock()
+        mock_response_investigate.text = json.dumps({
+            "action_type": "INVESTIGATE",
+            "files_to_read": ["test.py"],
+        })
+        mock_response_patch = MagicMock()
+        mock_response_patch.text = json.dumps({
+            "filepath": "test.py",
+            "full_code_block": "def fixed(): pass",
+            "explanation": "Fixed the function"
+        })
+        mock_client.models.generate_content.side_effect = [
+            Exception("429 RESOURCE_EXHAUSTED. Please retry in 2s"),
+            mock_response_investigate,
+            mock_response_patch,
+        ]
+        mock_get_client.return_value = mock_client
+
+        result = analyze_error("ValueError: test", "", file_tree="")
+
+        assert result.filepath == "test.py"
+        mock_sleep.assert_called_once_with(2.0)
+        assert mock_penalize.call_args[0][1] == 2.0
+
+    @patch('roma_debug.core.engine._read_requested_files')
+    @patch('roma_debug.core.engine._get_client')
+    def test_llm_cache_skips_repeat_calls(self, mock_get_client, mock_read_files):
+        """Test that ROMA_LLM_CACHE serves a repeat analysis from disk."""
+        mock_read_files.return_value = ([("test.py", "print('x')")], [], [])
+        mock_client = MagicMock()
+        mock_response_investigate = MagicMock()
+        mock_response_investigate.text = json.dumps({
+            "action_type": "INVESTIGATE",
+            "files_to_read": ["test.py"],
+        })
+        mock_response_patch = MagicMock()
+        mock_response_patch.text = json.dumps({
+            "filepath": "test.py",
+            "full_code_block": "def fixed(): pass",
+            "explanation": "Fixed the function"
+        })
+        mock_client.models.generate_content.side_effect = [
+            mock_response_investigate,
+            mock_response_patch,
+        ]
+        mock_get_client.return_value = mock_client
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            env = {"ROMA_LLM_CACHE": "1", "ROMA_CACHE_DIR": tmpdir}
+            with patch.dict(os.environ, env):
+                first = analyze_error("ValueError: test", "", file_tree="")
+                second = analyze_error("ValueError: test", "", file_tree="")
+
+        assert mock_client.models.generate_content.call_count == 2
+        assert second.full_code_block == first.full_code_block
+
+    @patch('roma_debug.core.engine._read_requested_files')
+    @patch('roma_debug.core.engine._get_client')
+    def test_race_models_uses_first_json_winner(self, mock_get_client, mock_read_files):
+        """Test that ROMA_RACE_MODELS lets a fallback model win the investigate step."""
+        mock_read_files.return_value = ([("test.py", "print('x')")], [], [])
+        investigate = json.dumps({"action_type": "INVESTIGATE", "files_to_read": ["test.py"]})
+        patch_text = json.dumps({
+            "filepath": "test.py",
+            "full_code_block": "def fixed(): pass",
+            "explanation": "Fixed the function"
+        })
+
+        def fake_generate(model, contents, config):
+            if model == "model-a":
+                raise Exception("503 UNAVAILABLE")
+            text = patch_text if "<FileContents>" in contents else investigate
+            return MagicMock(text=text)
+
+        mock_client = MagicMock()
+        mock_client.models.generate_content.side_effect = fake_generate
+        mock_get_client.return_value = mock_client
+
+        env = {"ROMA_RACE_MODELS": "2", "ROMA_MODELS": "model-a,model-b"}
+        with patch.dict(os.environ, env):
+            result = analyze_error("ValueError: test", "", file_tree="")
+
+        assert result.model_used == "model-b"
+        assert result.filepath == "test.py"
+
+    @patch('roma_debug.core.engine._get_client')
+    def test_skips_investigation_when_traceback_files_exist(self, mock_get_client):
+        """Test a traceback naming local files goes straight to the patch call."""
+        mock_client = MagicMock()
+        mock_response_patch = MagicMock()
+        mock_response_patch.text = json.dumps({
+            "filepath": "app.py",
+            "full_code_block": "x = 2",
+            "explanation": "Fixed"
+        })
+        mock_client.models.generate_content.side_effect = [mock_response_patch]
+        mock_get_client.return_value = mock_client
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(f"{tmpdir}/app.py", "w") as f:
+                f.write("x = 1\n")
+            log = (
+                "Traceback (most recent call last):\n"
+                '  File "app.py", line 1, in <module>\n'
+                "ValueError: bad"
+            )
+
+            result = analyze_error(log, "", project_root=tmpdir, file_tree="")
+
+        assert mock_client.models.generate_content.call_count == 1
+        assert result.filepath == "app.py"
+        assert result.files_read == ["app.py"]
+        assert result.files_read_sources == {"app.py": "traceback"}
+
+    @patch('roma_debug.core.engine._get_client')
+    def test_plain_question_is_answered_in_one_call(self, mock_get_client):
+        """Test a project question skips the investigate call."""
+        mock_client = MagicMock()
+        mock_response_answer = MagicMock()
+        mock_response_answer.text = json.dumps({
+            "action_type": "ANSWER",
+            "filepath": None,
+            "full_code_block": "",
+            "explanation": "There are 2 files."
+        })
+        mock_client.models.generate_content.side_effect = [mock_response_answer]
+        mock_get_client.return_value = mock_client
+
+        result = analyze_error("How many files are in src?", "", file_tree="src/\n  a.py\n  b.py")
+
+        assert mock_client.models.generate_content.call_count == 1
+        assert result.is_answer_only
+        assert result.explanation == "There are 2 files."
+
+    @patch('roma_debug.core.engine._read_requested_files')
+    @patch('roma_debug.core.engine._get_client')
+    def test_code_location_question_is_investigated(self, mock_get_client, mock_read_files):
+        """Test a 'where is X defined' question reads files before answering."""
+        mock_read_files.return_value = ([("routes.py", "def login(): pass")], [], [])
+        mock_client = MagicMock()
+        mock_client.models.generate_content.side_effect = [
+            MagicMock(text=json.dumps({"action_type": "INVESTIGATE", "files_to_read": ["routes.py"]})),
+            MagicMock(text=json.dumps({"action_type": "ANSWER", "explanation": "In routes.py."})),
+        ]
+        mock_get_client.return_value = mock_client
+
+        result = analyze_error("where is the login route defined", "", file_tree="routes.py")
+
+        assert mock_client.models.generate_content.call_count == 2
+        assert result.files_read == ["routes.py"]
+
+    @patch('roma_debug.core.engine.time.sleep')
+    @patch('roma_debug.core.engine._get_client')
+    def test_non_retryable_error_is_raised_immediately(self, mock_get_client, mock_sleep):
+        """Test that errors like an invalid key are not retried."""
+        mock_client = MagicMock()
+        mock_client.models.generate_content.side_effect = Exception("400 API key not valid")
+        mock_get_client.return_value = mock_client
+
+        with pytest.raises(Exception, match="API key not valid"):
+            analyze_error("ValueError: test", "", file_tree="")
+
+        assert mock_client.models.generate_content.call_count == 1
+        mock_sleep.assert_not_called()
+
+
+class TestAnalyzeErrorAsync:
+    """Tests for analyze_error_async with mocked API."""
+
+    @patch('roma_debug.core.engine._read_requested_files')
+    @patch('roma_debug.core.engine._get_client')
+    def test_returns_fix_result(self, mock_get_client, mock_read_files):
+        """Test that the async client is awaited and a FixResult returned."""
+        mock_read_files.return_value = ([("test.py", "print('x')")], [], [])
+        mock_client = MagicMock()
+        mock_response_investigate = MagicMock()
+        mock_response_investigate.text = json.dumps({
+            "action_type": "INVESTIGATE",
+            "files_to_read": ["test.py"],
+        })
+        mock_response_patch = MagicMock()
+        mock_response_patch.text = json.dumps({
+            "filepath": "test.py",
+            "full_code_block": "def fixed(): pass",
+            "explanation": "Fixed the function"
+        })
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=[
+            mock_response_investigate,
+            mock_response_patch,
+        ])
+        mock_get_client.return_value = mock_client
+
+        result = asyncio.run(analyze_error_async("ValueError: test", "", file_tree=""))
+
+        assert result.filepath == "test.py"
+        assert mock_client.aio.models.generate_content.await_count == 2
+        mock_client.models.generate_content.assert_not_called()
+
+    @patch('roma_debug.core.engine._read_requested_files')
+    @patch('roma_debug.core.engine._get_client')
+    def test_file_reads_run_off_the_event_loop(self, mock_get_client, mock_read_files):
+        """Test that the blocking work between model calls runs in a worker thread."""
+        read_threads = []
+
+        def read_files(files, project_root):
+            read_threads.append(threading.current_thread())
+            return [("test.py", "print('x')")], [], []
+
+        mock_read_files.side_effect = read_files
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=[
+            MagicMock(text=json.dumps({"action_type": "INVESTIGATE", "files_to_read": ["test.py"]})),
+            MagicMock(text=json.dumps({"filepath": "test.py", "full_code_block": "x = 1", "explanation": "e"})),
+        ])
+        mock_get_client.return_value = mock_client
+
+        result = asyncio.run(analyze_error_async("ValueError: test", "", file_tree=""))
+
+        assert result.filepath == "test.py"
+        assert read_threads and threading.main_thread() not in read_threads
+
+    @patch('roma_debug.core.engine._read_requested_files')
+    @patch('roma_debug.core.engine._get_client')
+    def test_stream_yields_chunks_then_result(self, mock_get_client, mock_read_files):
+        """Test that the patch step is streamed before the final FixResult."""
+        mock_read_files.return_value = ([("test.py", "print('x')")], [], [])
+        mock_client = MagicMock()
+        mock_response_investigate = MagicMock()
+        mock_response_investigate.text = json.dumps({
+            "action_type": "INVESTIGATE",
+            "files_to_read": ["test.py"],
+        })
+        mock_client.aio.models.generate_content = AsyncMock(
+            return_value=mock_response_investigate
+        )
+        patch_text = json.dumps({
+            "filepath": "test.py",
+            "full_code_block": "def fixed(): pass",
+            "explanation": "Fixed the function"
+        })
+
+        async def fake_stream():
+            for piece in (patch_text[:10], patch_text[10:]):
+                yield MagicMock(text=piece)
+
+        mock_client.aio.models.generate_content_stream = AsyncMock(return_value=fake_stream())
+        mock_get_client.return_value = mock_client
+
+        async def collect():
+            return [item async for item in analyze_error_stream("ValueError: test", "", file_tree="")]
+
+        items = asyncio.run(collect())
+
+        assert items[:-1] == [patch_text[:10], patch_text[10:]]
+        assert isinstance(items[-1], FixResult)
+        assert items[-1].full_code_block == "def fixed(): pass"
+
+    @patch('roma_debug.core.engine._read_requested_files')
+    @patch('roma_debug.core.engine._get_client')
+    def test_batch_returns_results_in_order(self, mock_get_client, mock_read_files):
+        """Test that a batch runs every pair and keeps input order."""
+        mock_read_files.return_value = ([("test.py", "print('x')")], [], [])
+
+        async def fake_generate(model, contents, config):
+            response = MagicMock()
+            if "<FileContents>" not in contents:
+                response.text = json.dumps({"action_type": "INVESTIGATE", "files_to_read": ["test.py"]})
+            else:
+                name = "a.py" if "ErrorA" in contents else "b.py"
+                response.text = json.dumps({"filepath": name, "full_code_block": "", "explanation": ""})
+            return response
+
+        mock_client = MagicMock()
+        mock_client.aio.models.generate_content = AsyncMock(side_effect=fake_generate)
+        mock_get_client.return_value = mock_client
+
+        results = asyncio.run(analyze_errors_batch(
+            [("ErrorA: x", ""), ("ErrorB: y", "")], file_tree="",
+        ))
+
+        assert [r.filepath for r in results] == ["a.py", "b.py"]
+        assert mock_client.aio.models.generate_content.await_count == 4
@@ -0,0 +1,81 @@
+"""Tests for the Gemini call limiter."""
+
+import asyncio
+import os
+import threading
+import weakref
+from unittest.mock import patch
+
+import pytest
+
+from roma_debug.core import limiter
+from roma_debug.core.limiter import TokenBucket
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter(monkeypatch):
+    """Give each test its own bucket registry and concurrency slots."""
+    monkeypatch.setattr(limiter, "_BUCKETS", {})
+    monkeypatch.setattr(
+        limiter,
+        "_THREAD_SLOTS",
+        threading.BoundedSemaphore(limiter._env_count("ROMA_MAX_CONCURRENCY", limiter.DEFAULT_MAX_CONCURRENCY)),
+    )
+    monkeypatch.setattr(limiter, "_LOOP_SLOTS", weakref.WeakKeyDictionary())
+
+
+class TestTokenBucket:
+    """Tests for per-key token buckets."""
+
+    def test_full_bucket_grants_without_wait(self):
+        """Test a fresh bucket serves its whole capacity immediately."""
+        bucket = TokenBucket(rpm=3)
+
+        assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+
+    def test_empty_bucket_reserves_future_token(self):
+        """Test callers past capacity are told how long to wait, in order."""
+        with patch("roma_debug.core.limiter.time.monotonic", return_value=100.0):
+            bucket = TokenBucket(rpm=60)
+            for _ in range(60):
+                bucket.reserve()
+
+            assert bucket.reserve() == 1.0
+            assert bucket.reserve() == 2.0
+
+    def test_penalize_delays_next_reservation(self):
+        """Test a server retry delay holds back the next caller."""
+        with patch("roma_debug.core.limiter.time.monotonic", return_value=100.0):
+            bucket = TokenBucket(rpm=60)
+            bucket.penalize(5.0)
+
+            assert bucket.reserve() == 5.0
+
+
+class TestSlots:
+    """Tests for the per-key registry and concurrency slots."""
+
+    def test_penalize_applies_to_the_key_bucket(self):
+        """Test a penalty on one key does not hold back another."""
+        with patch("roma_debug.core.limiter.time.monotonic", return_value=100.0):
+            limiter.penalize("a", 5.0)
+
+            assert limiter._bucket("a").reserve() > 0
+            assert limiter._bucket("b").reserve() == 0.0
+
+    def test_invalid_settings_fall_back_to_at_least_one(self):
+        """Test zero or malformed limits cannot deadlock the slots."""
+        with patch.dict(os.environ, {"ROMA_RPM_PER_KEY": "0", "ROMA_MAX_CONCURRENCY": "many"}):
+            assert limiter._bucket("k").capacity == 1.0
+            assert limiter._env_count("ROMA_MAX_CONCURRENCY", 8) == 8
+
+    def test_async_slots_are_per_event_loop(self):
+        """Test each event loop gets its own semaphore."""
+        async def enter():
+            async with limiter.aslot("k"):
+                return limiter._loop_slots()
+
+        first = asyncio.run(enter())
+        second = asyncio.run(enter())
+
+        assert first is not second
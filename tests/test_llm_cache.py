@@ -0,0 +1,69 @@
+"""Tests for the on-disk LLM response cache."""
+
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+from roma_debug.core import llm_cache
+
+
+class TestLlmCache:
+    """Tests for llm_cache get/put."""
+
+    def test_key_depends_on_model_prompt_system_and_config(self):
+        """Test keys differ per model, prompt, system instruction and config."""
+        key = llm_cache.cache_key("m1", "prompt")
+
+        assert key == llm_cache.cache_key("m1", "prompt")
+        assert key != llm_cache.cache_key("m2", "prompt")
+        assert key != llm_cache.cache_key("m1", "other")
+        assert key != llm_cache.cache_key("m1", "prompt", "system")
+        assert key != llm_cache.cache_key("m1", "prompt", "", '{"temperature": 1}')
+
+    def test_round_trip(self):
+        """Test a stored entry is returned on the next get."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.dict(os.environ, {"ROMA_CACHE_DIR": tmpdir}):
+                key = llm_cache.cache_key("m", "p")
+                assert llm_cache.get(key) is None
+
+                llm_cache.put(key, {"raw_text": "{}"})
+
+                assert llm_cache.get(key) == {"raw_text": "{}"}
+
+    def test_expired_entry_is_a_miss(self):
+        """Test entries older than the TTL are ignored."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.dict(os.environ, {"ROMA_CACHE_DIR": tmpdir}):
+                key = llm_cache.cache_key("m", "p")
+                llm_cache.put(key, {"raw_text": "{}"})
+                path = llm_cache.cache_dir() / key[:2] / f"{key}.json"
+                old = time.time() - 2 * llm_cache.DEFAULT_TTL_SECONDS
+                os.utime(path, (old, old))
+
+                assert llm_cache.get(key) is None
+
+    def test_repeat_hit_skips_file_read(self):
+        """Test an entry already loaded is served from memory."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.dict(os.environ, {"ROMA_CACHE_DIR": tmpdir}):
+                key = llm_cache.cache_key("m", "p")
+                llm_cache.put(key, {"raw_text": "{}"})
+
+                with patch.object(llm_cache.json, "load") as mock_load:
+                    assert llm_cache.get(key) == {"raw_text": "{}"}
+                    mock_load.assert_not_called()
+
+    def test_rewritten_entry_is_reloaded(self):
+        """Test memory entries are dropped once the file changes on disk."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with patch.dict(os.environ, {"ROMA_CACHE_DIR": tmpdir}):
+                key = llm_cache.cache_key("m", "p")
+                llm_cache.put(key, {"raw_text": "old"})
+                path = llm_cache.cache_dir() / key[:2] / f"{key}.json"
+                path.write_text('{"raw_text": "new"}', encoding="utf-8")
+                later = time.time() + 5
+                os.utime(path, (later, later))
+
+                assert llm_cache.get(key) == {"raw_text": "new"}
@@ -1,7 +1,7 @@
 """Tests for the multi-language parser system."""
 
 import pytest
-from roma_debug.core.models import Language, Symbol, Import
+from roma_debug.core.models import FileContext, Language, Symbol, Import
 from roma_debug.parsers.base import BaseParser
 from roma_debug.parsers.registry import detect_language, get_parser, get_registry
 from roma_debug.parsers.python_ast_parser import PythonAstParser
@@ -240,6 +240,16 @@ class TestSymbol:
         child = Symbol(name="method", kind="method", start_line=5, end_line=10, parent=parent)
         assert child.qualified_name == "MyClass.method"
 
+    def test_qualified_name_invalidation(self):
+        parent = Symbol(name="MyClass", kind="class", start_line=1, end_line=20)
+        child = Symbol(name="method", kind="method", start_line=5, end_line=10, parent=parent)
+        parent.children.append(child)
+        assert child.qualified_name == "MyClass.method"
+
+        parent.name = "Renamed"
+        parent.invalidate_qualified_name()
+        assert child.qualified_name == "Renamed.method"
+
 
 class TestImport:
     """Tests for the Import class."""
@@ -295,6 +305,27 @@ class TestImport:
         assert "import {" in imp.full_import_string
         assert "map" in imp.full_import_string
 
+    def test_file_context_to_dict_imports(self):
+        imp = Import(
+            module_name="numpy",
+            alias="np",
+            resolved_path="/site-packages/numpy/__init__.py",
+            language=Language.PYTHON,
+        )
+        ctx = FileContext(
+            filepath="app.py",
+            line_number=1,
+            context_type="ast",
+            content="import numpy as np",
+            imports=[imp],
+        )
+        assert ctx.to_dict()["imports"] == [{
+            "module_name": "numpy",
+            "alias": "np",
+            "imported_names": [],
+            "resolved_path": "/site-packages/numpy/__init__.py",
+        }]
+
 
 class TestTreeSitterParser:
     """Tests for the TreeSitter multi-language parser."""
@@ -294,3 +294,24 @@ class TestUpstreamContext:
         assert "main.main" in text
         assert "RELEVANT DEFINITIONS" in text
         assert "helper" in text
+
+
+class TestAnalysisContext:
+    """Tests for the analysis context model."""
+
+    def test_secondary_contexts_exclude_primary_file(self):
+        """Test traceback contexts in the primary file are filtered out."""
+        from roma_debug.core.models import AnalysisContext
+
+        primary = FileContext(filepath="app.py", line_number=5, context_type="traceback", content="x")
+        other = FileContext(filepath="lib.py", line_number=2, context_type="traceback", content="y")
+        ctx = AnalysisContext(primary_context=primary, traceback_contexts=[primary, other])
+
+        assert ctx.secondary_contexts == [other]
+        assert "### lib.py:2" in ctx.to_prompt_text()
+
+        ctx.traceback_contexts.append(FileContext(
+            filepath="extra.py", line_number=1, context_type="traceback", content="z",
+        ))
+        ctx.refresh()
+        assert [c.filepath for c in ctx.secondary_contexts] == ["lib.py", "extra.py"]